@@ -0,0 +1,20 @@
+import os
+
+# /analyze-stocks spends most of its time waiting on Alpha Vantage, so each
+# worker serves requests from a pool of threads instead of one at a time
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, os.cpu_count() or 1)))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = 120
+
+# Import the app once in the master and fork workers from it, so the parsed
+# modules and the preloaded analyst CSV are shared copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Drop the pooled SQLite connections the master opened while importing the app"""
+    from src.database.db_setup import engine
+    # close=False leaves the parent's connections alone; the worker opens its own
+    engine.dispose(close=False)
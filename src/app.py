@@ -1,9 +1,13 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.exc import IntegrityError
 from .database.db_setup import SessionLocal, Stock
-from .utils.alpha_vantage import AlphaVantageAPI
-import re
+from .utils.alpha_vantage import AlphaVantageAPI, CacheMissError, TransientAPIError
+from .utils.json_provider import OrjsonProvider
 import os
+import logging
+import numpy as np
 from .data_sources.manager import DataSourceManager
 from .data_sources.alpha_vantage_source import AlphaVantageSource
 from .data_sources.analyst_source import AnalystDataSource
@@ -12,9 +16,48 @@ from .integration.integration_system import DataIntegrationSystem
 # Get the application root directory
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 
+# Debug output is opt-in via LOG_LEVEL=DEBUG; %-style arguments are only formatted when enabled
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING'))
+logger = logging.getLogger(__name__)
+
+# Score lookup tables: a P/E at or below each edge earns the matching score,
+# while an ROE must reach an edge to earn the score after it
+PE_EDGES = (10, 15, 20, 25, 30)
+PE_SCORES = (1.0, 0.8, 0.6, 0.4, 0.2, 0.0)
+ROE_EDGES = (10, 15, 20, 25, 30)
+ROE_SCORES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+PE_EDGE_TABLE, PE_SCORE_TABLE = np.array(PE_EDGES), np.array(PE_SCORES)
+ROE_EDGE_TABLE, ROE_SCORE_TABLE = np.array(ROE_EDGES), np.array(ROE_SCORES)
+
+def _score(edges, scores, values, side):
+    """Look up the score band for each value; zero and negative values score 0"""
+    return np.where(values > 0, scores[np.searchsorted(edges, values, side=side)], 0.0)
+
+# Analyst CSV columns copied onto analysed stocks
+ANALYST_FIELDS = (
+    'analysis_date', 'analyst_ratings_buy', 'analyst_ratings_hold', 'analyst_ratings_sell',
+    'analyst_ratings_strong_sell', 'analyst_ratings_strong_buy', 'rsi', 'macd',
+    'volatility', 'sentiment_score', 'beta'
+)
+
+# Hot-path statements are built once; values are passed as bound parameters so
+# SQLAlchemy's compiled-statement cache is hit on every request
+LIST_STOCKS = select(
+    Stock.symbol, Stock.current_price, Stock.pe_ratio, Stock.roe, Stock.total_score
+).execution_options(yield_per=500)  # Stream rows in batches instead of buffering the whole table
+STOCK_SYMBOLS = select(Stock.symbol)
+DELETE_STOCK = delete(Stock).where(Stock.symbol == bindparam('symbol'))
+DELETE_STOCKS = delete(Stock).where(Stock.symbol.in_(bindparam('symbols', expanding=True)))
+
+# The analyst CSV changes rarely, so it is loaded once per process rather than per request
+analyst_source = AnalystDataSource(csv_path=os.path.join(os.path.dirname(APP_ROOT), 'analyst_data.csv'))
+if not analyst_source.connect():
+    logger.error("Error loading analyst data from %s", analyst_source.csv_path)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
-# Simplified CORS setup
+# Simplified CORS setup; flask-cors emits all CORS headers, including Max-Age on preflights
 CORS(app, 
      origins=["https://buffett-portfolio-analyzer-iiitd.vercel.app"],
      allow_headers=["Content-Type", "Authorization"],
@@ -22,217 +65,197 @@ CORS(app,
      supports_credentials=True,
      max_age=86400)
 
-@app.after_request
-def after_request(response):
-    origin = request.headers.get('Origin')
-    if origin == 'https://buffett-portfolio-analyzer-iiitd.vercel.app':
-        response.headers['Access-Control-Allow-Origin'] = origin
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-    return response
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """Release the request's scoped database session back to the pool"""
+    SessionLocal.remove()
 
 def validate_stock_symbol(symbol):
     """Validate stock symbol format (1-5 uppercase letters)"""
-    pattern = r'^[A-Z]{1,5}$'
-    return bool(re.match(pattern, symbol))
+    return 1 <= len(symbol) <= 5 and symbol.isascii() and symbol.isalpha() and symbol.isupper()
 
 @app.route('/stocks', methods=['GET'])
 def get_stocks():
-    print("Received GET request for /stocks")  # Debug log
+    logger.debug("Received GET request for /stocks")
     db = SessionLocal()
     try:
-        print("Querying database...")  # Debug log
-        stocks = db.query(Stock).all()
-        print(f"Found {len(stocks)} stocks")  # Debug log
-        stock_list = []
-        for stock in stocks:
-            stock_data = {
-                'symbol': stock.symbol,
-                'current_price': stock.current_price,
-                'pe_ratio': stock.pe_ratio,
-                'roe': stock.roe,
-                'total_score': stock.total_score
+        logger.debug("Querying database...")
+        # Select only the listed columns so rows come back as plain tuples, not ORM objects,
+        # and build the response while rows are still being fetched
+        rows = db.execute(LIST_STOCKS)
+        stock_list = [
+            {
+                'symbol': symbol,
+                'current_price': current_price,
+                'pe_ratio': pe_ratio,
+                'roe': roe,
+                'total_score': total_score
             }
-            stock_list.append(stock_data)
-        print(f"Returning {len(stock_list)} stocks")  # Debug log
+            for symbol, current_price, pe_ratio, roe, total_score in rows
+        ]
+        logger.debug("Returning %d stocks", len(stock_list))
         return jsonify(stock_list)
     except Exception as e:
-        print(f"Error in /stocks: {str(e)}")  # Debug log
+        logger.error("Error in /stocks: %s", e)
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.close()
 
 @app.route('/stocks', methods=['POST'])
 def add_stock():
-    print("\n=== Adding Stock ===")  # Debug log
+    logger.debug("=== Adding Stock ===")
     data = request.json
-    print("Received data:", data)  # Debug log
+    logger.debug("Received data: %s", data)
     
     symbol = data.get('symbol', '').strip().upper()
-    print(f"Processing symbol: {symbol}")  # Debug log
+    logger.debug("Processing symbol: %s", symbol)
     
     if not symbol:
-        print("Error: No symbol provided")  # Debug log
+        logger.debug("Error: No symbol provided")
         return jsonify({'message': 'Stock symbol is required'}), 400
         
     if not validate_stock_symbol(symbol):
-        print(f"Error: Invalid symbol format: {symbol}")  # Debug log
+        logger.debug("Error: Invalid symbol format: %s", symbol)
         return jsonify({'message': 'Invalid stock symbol format'}), 400
     
     db = SessionLocal()
     try:
-        # Check if symbol already exists
-        print(f"Checking if {symbol} exists in database...")  # Debug log
-        existing_stock = db.query(Stock).filter(Stock.symbol == symbol).first()
-        if existing_stock:
-            print(f"Stock {symbol} already exists")  # Debug log
-            return jsonify({'message': f'Stock {symbol} already exists'}), 400
-            
-        # Add new stock
-        print(f"Adding new stock: {symbol}")  # Debug log
+        # Add new stock; the primary key on symbol rejects duplicates in the same round trip
+        logger.debug("Adding new stock: %s", symbol)
         new_stock = Stock(symbol=symbol)
         db.add(new_stock)
         db.commit()
-        print(f"Successfully added stock: {symbol}")  # Debug log
+        logger.debug("Successfully added stock: %s", symbol)
         return jsonify({'message': f'Stock {symbol} added successfully'}), 201
         
+    except IntegrityError:
+        logger.debug("Stock %s already exists", symbol)
+        db.rollback()
+        return jsonify({'message': f'Stock {symbol} already exists'}), 400
     except Exception as e:
-        print(f"Error adding stock: {str(e)}")  # Debug log
+        logger.error("Error adding stock: %s", e)
         db.rollback()
         return jsonify({'message': f'Error adding stock: {str(e)}'}), 500
-    finally:
-        db.close()
 
-@app.route('/analyze-stocks', methods=['POST', 'OPTIONS'])
+# Flask answers OPTIONS automatically for POST-only routes and flask-cors adds the
+# preflight headers, so the view itself only ever runs for POST
+@app.route('/analyze-stocks', methods=['POST'])
 def analyze_stocks():
-    print("\n=== Starting Stock Analysis ===")
-    print(f"Request method: {request.method}")
-    print(f"Request headers: {dict(request.headers)}")
+    logger.debug("=== Starting Stock Analysis ===")
+    logger.debug("Request method: %s", request.method)
+    logger.debug("Request headers: %s", request.headers)
     
-    # Handle OPTIONS preflight request
-    if request.method == "OPTIONS":
-        response = jsonify({"message": "Preflight request successful"})
-        origin = request.headers.get('Origin')
-        if origin == 'https://buffett-portfolio-analyzer-iiitd.vercel.app':
-            response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response, 200
-        
     api_key = os.getenv('ALPHA_VANTAGE_API_KEY')
-    print(f"API Key present: {'Yes' if api_key else 'No'}")
+    logger.debug("API Key present: %s", 'Yes' if api_key else 'No')
     
-    if not api_key:
+    api = AlphaVantageAPI()
+    # Offline mode serves demo data and never calls the API, so it needs no key
+    if not api_key and not api.offline:
+        api.close()
         error_msg = "Alpha Vantage API key not found!"
-        print(error_msg)
+        logger.error(error_msg)
         return jsonify({'error': error_msg}), 500
     
     db = SessionLocal()
-    api = AlphaVantageAPI()
     
     try:
-        stocks = db.query(Stock).all()
-        print(f"Found {len(stocks)} stocks to analyze")
+        symbols = db.scalars(STOCK_SYMBOLS).all()
+        logger.debug("Found %d stocks to analyze", len(symbols))
         
-        if not stocks:
-            print("No stocks found in database")
+        if not symbols:
+            logger.debug("No stocks found in database")
             return jsonify({'error': 'No stocks found to analyze'}), 404
             
         results = []
         invalid_stocks = []
+        skipped_stocks = []
+        updates = []
+        
+        # Fetch market data for all stocks concurrently; the calls are network-bound.
+        # Pass ?fresh=1 to bypass the metrics cache and hit Alpha Vantage directly.
+        metrics_by_symbol = api.get_all_metrics_batch(
+            symbols, use_cache=request.args.get('fresh') != '1', max_workers=8
+        )
+        
+        # Look up analyst data for every stock in a single query
+        analyst_map = analyst_source.execute_query_many(symbols)
         
-        for stock in stocks:
-            print(f"\n=== Processing {stock.symbol} ===")
+        # Collect usable metrics first so scores can be computed for all stocks at once
+        scored = []
+        for symbol in symbols:
+            logger.debug("=== Processing %s ===", symbol)
             try:
-                # Get market data
-                metrics = api.get_all_metrics(stock.symbol)
-                print(f"Market metrics for {stock.symbol}: {metrics}")
+                # Get market data; throttling or a replay-mode cache miss says nothing
+                # about the symbol, so the stock is left untouched for a later run
+                try:
+                    metrics = metrics_by_symbol[symbol]
+                    if isinstance(metrics, Exception):
+                        raise metrics
+                except (TransientAPIError, CacheMissError) as e:
+                    logger.warning("Skipping %s, Alpha Vantage unavailable: %s", symbol, e)
+                    skipped_stocks.append(symbol)
+                    continue
+                logger.debug("Market metrics for %s: %s", symbol, metrics)
                 
                 if metrics is None:
-                    print(f"No metrics available for {stock.symbol}, marking as invalid")
-                    invalid_stocks.append(stock.symbol)
-                    db.delete(stock)
+                    logger.debug("No metrics available for %s, marking as invalid", symbol)
+                    invalid_stocks.append(symbol)
                     continue
                 
                 if metrics.get('current_price') is None:
-                    print(f"No price data for {stock.symbol}, marking as invalid")
-                    invalid_stocks.append(stock.symbol)
-                    db.delete(stock)
+                    logger.debug("No price data for %s, marking as invalid", symbol)
+                    invalid_stocks.append(symbol)
                     continue
                 
-                # Update stock with market metrics
-                stock.current_price = metrics['current_price']
-                stock.pe_ratio = metrics['pe_ratio']
-                stock.roe = metrics['roe']
-                print(f"Updated market metrics - price: {stock.current_price}, pe: {stock.pe_ratio}, roe: {stock.roe}")
-                
-                # Calculate scores
-                print(f"\nCalculating scores for {stock.symbol}:")
-                
-                # PE Score calculation
-                if metrics['pe_ratio'] <= 0:  # Handle negative or zero P/E
-                    pe_score = 0
-                elif metrics['pe_ratio'] <= 10:
-                    pe_score = 1.0
-                elif metrics['pe_ratio'] <= 15:
-                    pe_score = 0.8
-                elif metrics['pe_ratio'] <= 20:
-                    pe_score = 0.6
-                elif metrics['pe_ratio'] <= 25:
-                    pe_score = 0.4
-                elif metrics['pe_ratio'] <= 30:
-                    pe_score = 0.2
-                else:
-                    pe_score = 0
-                
-                print(f"PE Score: {pe_score}")
+                scored.append((symbol, metrics['current_price'], float(metrics['pe_ratio']), float(metrics['roe'])))
                 
-                # ROE Score calculation
-                if metrics['roe'] <= 0:  # Handle negative ROE
-                    roe_score = 0
-                elif metrics['roe'] >= 30:
-                    roe_score = 1.0
-                elif metrics['roe'] >= 25:
-                    roe_score = 0.8
-                elif metrics['roe'] >= 20:
-                    roe_score = 0.6
-                elif metrics['roe'] >= 15:
-                    roe_score = 0.4
-                elif metrics['roe'] >= 10:
-                    roe_score = 0.2
-                else:
-                    roe_score = 0
-                
-                print(f"ROE Score: {roe_score}")
-                
-                # Calculate total score
-                total_score = (pe_score + roe_score) / 2
-                print(f"Total Score: {total_score}")
+            except Exception as e:
+                logger.warning("Error processing %s: %s", symbol, e)
+                invalid_stocks.append(symbol)
+        
+        if scored:
+            # Score every stock in a handful of array operations
+            pe_ratios = np.fromiter((row[2] for row in scored), dtype=np.float64, count=len(scored))
+            roes = np.fromiter((row[3] for row in scored), dtype=np.float64, count=len(scored))
+            pe_scores = _score(PE_EDGE_TABLE, PE_SCORE_TABLE, pe_ratios, side='left')
+            roe_scores = _score(ROE_EDGE_TABLE, ROE_SCORE_TABLE, roes, side='right')
+            total_scores = (pe_scores + roe_scores) / 2
+            
+            # Back to Python floats for the database driver and JSON response
+            for (symbol, current_price, pe_ratio, roe), pe_score, roe_score, total_score in zip(
+                    scored, pe_scores.tolist(), roe_scores.tolist(), total_scores.tolist()):
+                logger.debug("Scores for %s - pe: %s, roe: %s, total: %s", symbol, pe_score, roe_score, total_score)
                 
-                # Update stock scores
-                stock.pe_score = pe_score
-                stock.roe_score = roe_score
-                stock.total_score = total_score
+                # Queue the row update; all rows are written in one batch below
+                row = {
+                    'symbol': symbol,
+                    'current_price': current_price,
+                    'pe_ratio': pe_ratio,
+                    'roe': roe,
+                    'pe_score': pe_score,
+                    'roe_score': roe_score,
+                    'total_score': total_score
+                }
+                analyst_data = analyst_map.get(symbol)
+                if analyst_data:
+                    row.update((field, analyst_data[field]) for field in ANALYST_FIELDS)
+                updates.append(row)
                 
                 # Add to results
                 results.append({
-                    'symbol': stock.symbol,
-                    'current_price': metrics['current_price'],
-                    'pe_ratio': metrics['pe_ratio'],
-                    'roe': metrics['roe'],
+                    'symbol': symbol,
+                    'current_price': current_price,
+                    'pe_ratio': pe_ratio,
+                    'roe': roe,
                     'total_score': total_score
                 })
-                
-            except Exception as e:
-                print(f"Error processing {stock.symbol}: {str(e)}")
-                invalid_stocks.append(stock.symbol)
-                db.delete(stock)
         
-        print("\nCommitting changes to database...")
+        logger.debug("Committing changes to database...")
+        if updates:
+            # ORM bulk UPDATE by primary key: one executemany, no per-object attribute tracking
+            db.execute(update(Stock), updates)
+        if invalid_stocks:
+            db.execute(DELETE_STOCKS, {'symbols': invalid_stocks}, execution_options={'synchronize_session': False})
         db.commit()
-        print("Database updated successfully")
+        logger.debug("Database updated successfully")
         
         # Prepare response
         response_data = {
@@ -244,16 +267,19 @@ def analyze_stocks():
             response_data['message'] = f'Analysis completed. Removed invalid stocks: {", ".join(invalid_stocks)}'
         else:
             response_data['message'] = 'Analysis completed successfully'
+        if skipped_stocks:
+            response_data['skipped_stocks'] = skipped_stocks
+            response_data['message'] += f'. Skipped (market data unavailable, retry later): {", ".join(skipped_stocks)}'
         
         return jsonify(response_data), 200
         
     except Exception as e:
         error_msg = f"Error during analysis: {str(e)}"
-        print(error_msg)
+        logger.error(error_msg)
         db.rollback()
         return jsonify({'error': error_msg, 'status': 'error'}), 500
     finally:
-        db.close()
+        api.close()
 
 @app.route('/', methods=['GET'])
 def home():
@@ -263,17 +289,15 @@ def home():
 def remove_stock(symbol):
     db = SessionLocal()
     try:
-        stock = db.query(Stock).filter(Stock.symbol == symbol).first()
-        if stock:
-            db.delete(stock)
+        # Delete by primary key in one statement, without loading the row first
+        result = db.execute(DELETE_STOCK, {'symbol': symbol})
+        if result.rowcount:
             db.commit()
             return jsonify({'message': f'Stock {symbol} removed successfully'})
         return jsonify({'error': f'Stock {symbol} not found'}), 404
     except Exception as e:
         db.rollback()
         return jsonify({'error': f'Failed to remove stock {symbol}'}), 400
-    finally:
-        db.close()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5001, debug=os.getenv('FLASK_DEBUG') == '1') 
\ No newline at end of file
@@ -1,11 +1,57 @@
+import aiohttp
+import asyncio
 import requests
-from typing import Dict, List, Any
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any, Tuple
 from .base import DataSourceInterface, DataSourceMetadata
+from .cache import PersistentCache
 import time
-import json
+import hashlib
+import orjson
 import os
+import random
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+
+# Sliding window of request start times shared by every instance in the process
+# (free tier allows 5 requests per minute; raise ALPHA_VANTAGE_RPM on paid plans)
+REQUESTS_PER_MINUTE = int(os.getenv('ALPHA_VANTAGE_RPM', 5))
+_call_times = deque()
+_rate_lock = threading.Lock()
+
+# Responses are shared process-wide; quotes go stale within minutes, fundamentals change daily.
+# Kept apart from utils.alpha_vantage's ResponseCache file so the two never contend for one database.
+response_cache = PersistentCache(os.getenv('ALPHA_VANTAGE_SOURCE_CACHE', 'av_source_cache.sqlite'), default_ttl=3600)
+CACHE_TTLS = {
+    'GLOBAL_QUOTE': 300,
+    'OVERVIEW': 86400,
+    'INCOME_STATEMENT': 86400
+}
+
+# REALTIME_BULK_QUOTES accepts up to this many comma-separated symbols per call
+BULK_QUOTE_LIMIT = 100
+# Bulk quote row field -> GLOBAL_QUOTE field, so bulk results can stand in for single quotes
+_BULK_QUOTE_FIELDS = (
+    ('symbol', '01. symbol'),
+    ('open', '02. open'),
+    ('high', '03. high'),
+    ('low', '04. low'),
+    ('close', '05. price'),
+    ('volume', '06. volume'),
+    ('previous_close', '08. previous close'),
+    ('change', '09. change')
+)
 
 class AlphaVantageSource(DataSourceInterface):
+    # Common stock symbols for validation when API is rate limited
+    KNOWN_SYMBOLS = frozenset({
+        'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'META', 'TSLA', 'NVDA', 'JPM',
+        'BAC', 'WMT', 'PG', 'JNJ', 'UNH', 'MA', 'HD', 'INTC', 'VZ',
+        'T', 'PFE', 'KO', 'DIS', 'NFLX', 'ADBE', 'CSCO', 'CRM'
+        # Add more common symbols as needed
+    })
+
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = 'https://www.alphavantage.co/query'
@@ -14,58 +60,44 @@ class AlphaVantageSource(DataSourceInterface):
             type="api",
             description="Real-time financial data from Alpha Vantage API"
         )
-        self.session = None
-        self.rate_limit_delay = 12
-        self.last_call_time = 0
+        # Every call goes to one host, so keep a small pool of keep-alive connections
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=16))
+        self.session.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip'})
+        self._aiohttp_session = None  # Async counterpart, opened on first await
+        self.max_retries = 5
+        self.backoff_base = 1.0  # Seconds; doubled on each retry
+        self.backoff_cap = 60.0
+        self.backoff_jitter = 1.0
+        # AIMD estimate of how many calls the API currently tolerates in flight;
+        # async requests wait for one of int(concurrency) slots before going out
+        self.concurrency = 1.0
+        self._in_flight = 0
+        self._slots_changed = None  # asyncio.Condition, bound to the loop that first awaits it
+        self._slots_loop = None
         self.is_rate_limited = False
-        self.cache_file = 'av_cache.json'
-        self.load_cache()
-        
-        # Common stock symbols for validation when API is rate limited
-        self.known_symbols = {
-            'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'META', 'TSLA', 'NVDA', 'JPM',
-            'BAC', 'WMT', 'PG', 'JNJ', 'UNH', 'MA', 'HD', 'INTC', 'VZ',
-            'T', 'PFE', 'KO', 'DIS', 'NFLX', 'ADBE', 'CSCO', 'CRM'
-            # Add more common symbols as needed
-        }
-
-    def load_cache(self):
-        """Load cached responses"""
-        try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r') as f:
-                    self.cache = json.load(f)
-            else:
-                self.cache = {}
-        except Exception:
-            self.cache = {}
-
-    def save_cache(self):
-        """Save responses to cache"""
-        try:
-            with open(self.cache_file, 'w') as f:
-                json.dump(self.cache, f)
-        except Exception as e:
-            print(f"Error saving cache: {e}")
+        self.bulk_quotes_supported = True  # Cleared once the key is refused the premium bulk endpoint
 
     def get_cache_key(self, params: Dict) -> str:
-        """Generate cache key from query parameters"""
-        return f"{params.get('function')}_{params.get('symbol')}"
+        """Generate cache key from every query parameter except the API key"""
+        normalized = orjson.dumps({k: v for k, v in params.items() if k != 'apikey'}, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(normalized, digest_size=16).hexdigest()
+
+    def get_cached(self, query: Dict[str, Any]):
+        """Return the unexpired cached response for query, or None"""
+        return response_cache.get(self.get_cache_key(query))
 
     def connect(self) -> bool:
-        """Initialize session"""
+        """Check connectivity using the pooled session"""
         try:
-            self.session = requests.Session()
             return self.health_check()
         except Exception as e:
             self.metadata.update_status(False, str(e))
             return False
 
     def disconnect(self) -> bool:
-        """Close session"""
-        if self.session:
-            self.session.close()
-            self.session = None
+        """Close pooled connections; the session reopens them if used again"""
+        self.session.close()
         return True
 
     def get_schema(self) -> Dict[str, List[str]]:
@@ -101,13 +133,53 @@ class AlphaVantageSource(DataSourceInterface):
             self.metadata.update_status(False, str(e))
             return False
 
+    def _reserve_slot(self) -> float:
+        """Reserve a slot in the shared per-minute request window, returning the seconds to wait"""
+        with _rate_lock:
+            now = time.monotonic()
+            while _call_times and now - _call_times[0] >= 60:
+                _call_times.popleft()
+            # Reserve the earliest slot so concurrent callers queue in order
+            start = now if len(_call_times) < REQUESTS_PER_MINUTE else _call_times[-REQUESTS_PER_MINUTE] + 60
+            _call_times.append(start)
+        return max(0.0, start - now)
+
     def _respect_rate_limit(self):
-        """Ensure we don't exceed API rate limits"""
-        current_time = time.time()
-        time_since_last_call = current_time - self.last_call_time
-        if time_since_last_call < self.rate_limit_delay:
-            time.sleep(self.rate_limit_delay - time_since_last_call)
-        self.last_call_time = time.time()
+        """Block until a request slot is free"""
+        wait = self._reserve_slot()
+        if wait:
+            time.sleep(wait)
+
+    def _backoff_delay(self, attempt: int, retry_after: str = None) -> float:
+        """Seconds to wait before retrying, honouring Retry-After when present"""
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return min(self.backoff_cap, self.backoff_base * 2 ** attempt + random.random() * self.backoff_jitter)
+
+    def _adjust_concurrency(self, success: bool):
+        """Additive increase on success, multiplicative decrease when throttled"""
+        if success:
+            self.concurrency = min(8.0, self.concurrency + 0.5)
+        else:
+            self.concurrency = max(1.0, self.concurrency * 0.5)
+
+    @asynccontextmanager
+    async def _in_flight_slot(self):
+        """Hold one of the int(self.concurrency) slots for async requests"""
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._slots_changed = asyncio.Condition()
+            self._slots_loop = loop
+            self._in_flight = 0
+        async with self._slots_changed:
+            await self._slots_changed.wait_for(lambda: self._in_flight < int(self.concurrency))
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._slots_changed:
+                self._in_flight -= 1
+                self._slots_changed.notify_all()
 
     async def validate_symbol(self, symbol: str) -> tuple[bool, str]:
         """
@@ -116,11 +188,8 @@ class AlphaVantageSource(DataSourceInterface):
         """
         # First check if we're already rate limited
         if self.is_rate_limited:
-            # If rate limited, validate against known symbols
-            is_valid = symbol in self.known_symbols
-            message = ("Using cached validation - API rate limited. "
-                      "Symbol accepted based on common stocks database.")
-            return is_valid, message
+            return self._fallback(symbol, "Using cached validation - API rate limited. "
+                                          "Symbol accepted based on common stocks database.")
 
         try:
             params = {
@@ -128,17 +197,23 @@ class AlphaVantageSource(DataSourceInterface):
                 'symbol': symbol,
                 'apikey': self.api_key
             }
-            response = self.session.get(self.base_url, params=params)
-            data = response.json()
+            # Goes through the same in-flight and per-minute limits as aexecute_query;
+            # _retry_delay classifies the response and updates the AIMD estimate
+            async with self._in_flight_slot():
+                await asyncio.sleep(self._reserve_slot())
+                status, data, _ = await self._aget(params)
+                throttled = self._retry_delay(0, status, data) is not None
+            
+            # 429/5xx bodies are dropped, so an empty result says nothing about the symbol
+            if status == 429 or status >= 500:
+                return self._fallback(symbol, "API unavailable. "
+                                              "Validating against common stocks database.")
             
             # Check for rate limit
-            if 'Note' in data or 'Information' in data:
+            if throttled:
                 self.is_rate_limited = True
-                # If rate limited, fall back to known symbols
-                is_valid = symbol in self.known_symbols
-                message = ("API rate limit reached. "
-                         "Validating against common stocks database.")
-                return is_valid, message
+                return self._fallback(symbol, "API rate limit reached. "
+                                              "Validating against common stocks database.")
             
             # Check if we got actual stock data
             if 'Global Quote' in data and data['Global Quote']:
@@ -147,55 +222,192 @@ class AlphaVantageSource(DataSourceInterface):
             return False, "Symbol not found in Alpha Vantage database"
             
         except Exception as e:
-            self.logger.error(f"Error validating symbol {symbol}: {str(e)}")
-            # If there's an error, fall back to known symbols
-            is_valid = symbol in self.known_symbols
-            message = f"API error. Validating against common stocks database."
-            return is_valid, message
+            print(f"Error validating symbol {symbol}: {str(e)}")
+            return self._fallback(symbol, "API error. Validating against common stocks database.")
+
+    def _fallback(self, symbol: str, message: str) -> Tuple[bool, str]:
+        """Validate against KNOWN_SYMBOLS when the API can't answer"""
+        return symbol in self.KNOWN_SYMBOLS, message
+
+    def _retry_delay(self, attempt: int, status: int, data: Dict, retry_after: str = None):
+        """Return seconds to wait before retrying a throttled response, or None if it succeeded"""
+        # Throttling shows up as 429/5xx or as a 'Note'/'Information' body
+        throttled = status == 429 or status >= 500 or 'Note' in data or 'Information' in data
+        self._adjust_concurrency(not throttled)
+        if not throttled:
+            return None
+        return self._backoff_delay(attempt, retry_after)
+
+    def _process_response(self, query: Dict[str, Any], data: Dict) -> Dict[str, Any]:
+        """Turn an unthrottled response into a result, caching successful ones"""
+        symbol = query.get('symbol')
+        
+        # Check for error messages
+        if 'Error Message' in data:
+            return {'error': f"Invalid symbol or data not found: {data['Error Message']}"}
+        
+        # Check if response is empty
+        if self._is_empty_response(data):
+            return {'error': f"No data found for symbol {symbol}"}
+        
+        # Cache successful response
+        response_cache.set(self.get_cache_key(query), data, CACHE_TTLS.get(query.get('function')))
+        
+        return data
 
     def execute_query(self, query: Dict[str, Any]) -> Dict[str, Any]:
         """Execute query with validation and caching"""
-        cache_key = self.get_cache_key(query)
         symbol = query.get('symbol')
         
         # Check cache first
-        if cache_key in self.cache:
+        cached = self.get_cached(query)
+        if cached is not None:
             print(f"Using cached data for {symbol}")
-            return self.cache[cache_key]
+            return cached
 
-        self._respect_rate_limit()
-        
         try:
-            response = self.session.get(self.base_url, params={
-                **query,
-                'apikey': self.api_key
-            })
-            
-            data = response.json()
-            
-            # Check for rate limit message
-            if 'Note' in data or 'Information' in data:
-                print(f"API rate limit reached. Using demo data for {symbol}...")
-                return self.get_demo_data(symbol)
-            
-            # Check for error messages
-            if 'Error Message' in data:
-                return {'error': f"Invalid symbol or data not found: {data['Error Message']}"}
-            
-            # Check if response is empty
-            if self._is_empty_response(data):
-                return {'error': f"No data found for symbol {symbol}"}
+            for attempt in range(self.max_retries + 1):
+                self._respect_rate_limit()
+                response = self.session.get(self.base_url, params={
+                    **query,
+                    'apikey': self.api_key
+                })
+                throttled = response.status_code == 429 or response.status_code >= 500
+                data = {} if throttled else orjson.loads(response.content)
+                
+                delay = self._retry_delay(attempt, response.status_code, data, response.headers.get('Retry-After'))
+                if delay is None:
+                    return self._process_response(query, data)
+                if attempt == self.max_retries:
+                    break
+                print(f"API throttled for {symbol}, retrying in {delay:.1f}s...")
+                time.sleep(delay)
             
-            # Cache successful response
-            self.cache[cache_key] = data
-            self.save_cache()
+            print(f"API rate limit reached. Using demo data for {symbol}...")
+            return self.get_demo_data(symbol)
+                
+        except Exception as e:
+            self.metadata.update_status(False, str(e))
+            return {'error': str(e)}
+
+    async def _aget(self, params: Dict[str, str]) -> Tuple[int, Dict, str]:
+        """Issue a GET on the shared aiohttp session, returning (status, data, Retry-After)"""
+        if self._aiohttp_session is None or self._aiohttp_session.closed:
+            # Created lazily so it binds to the running event loop
+            self._aiohttp_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=8, ttl_dns_cache=300, keepalive_timeout=60),
+                headers={'Accept-Encoding': 'gzip'}
+            )
+        async with self._aiohttp_session.get(self.base_url, params=params) as response:
+            throttled = response.status == 429 or response.status >= 500
+            data = {} if throttled else orjson.loads(await response.read())
+            return response.status, data, response.headers.get('Retry-After')
+
+    async def aexecute_query(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Async execute_query; many symbols can be in flight on one event loop"""
+        symbol = query.get('symbol')
+        
+        # Check cache first
+        cached = self.get_cached(query)
+        if cached is not None:
+            print(f"Using cached data for {symbol}")
+            return cached
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                # Fan-out is capped by the AIMD estimate, which _retry_delay updates
+                async with self._in_flight_slot():
+                    await asyncio.sleep(self._reserve_slot())
+                    status, data, retry_after = await self._aget({**query, 'apikey': self.api_key})
+                    delay = self._retry_delay(attempt, status, data, retry_after)
+                
+                if delay is None:
+                    return self._process_response(query, data)
+                if attempt == self.max_retries:
+                    break
+                print(f"API throttled for {symbol}, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
             
-            return data
+            print(f"API rate limit reached. Using demo data for {symbol}...")
+            return self.get_demo_data(symbol)
                 
         except Exception as e:
             self.metadata.update_status(False, str(e))
             return {'error': str(e)}
 
+    async def fetch_batch(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch GLOBAL_QUOTE responses for many symbols, using one bulk request per
+        BULK_QUOTE_LIMIT symbols and falling back to concurrent single-symbol calls.
+        Results are cached under each symbol's GLOBAL_QUOTE query, so later
+        per-symbol lookups are served from the cache.
+        """
+        quotes = {}
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            cached = self.get_cached({'function': 'GLOBAL_QUOTE', 'symbol': symbol})
+            if cached is not None:
+                quotes[symbol] = cached
+            else:
+                missing.append(symbol)
+        
+        for start in range(0, len(missing), BULK_QUOTE_LIMIT):
+            if not self.bulk_quotes_supported:
+                break
+            quotes.update(await self._fetch_bulk_quotes(missing[start:start + BULK_QUOTE_LIMIT]))
+        
+        # Whatever the bulk endpoint didn't cover goes out one symbol at a time
+        remaining = [symbol for symbol in missing if symbol not in quotes]
+        if remaining:
+            fetched = await asyncio.gather(*(
+                self.aexecute_query({'function': 'GLOBAL_QUOTE', 'symbol': symbol}) for symbol in remaining
+            ))
+            quotes.update(zip(remaining, fetched))
+        
+        return quotes
+
+    async def _fetch_bulk_quotes(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch one REALTIME_BULK_QUOTES page, returning GLOBAL_QUOTE-shaped results by symbol"""
+        try:
+            await asyncio.sleep(self._reserve_slot())
+            status, data, _ = await self._aget({
+                'function': 'REALTIME_BULK_QUOTES',
+                'symbol': ','.join(symbols),
+                'apikey': self.api_key
+            })
+        except Exception as e:
+            print(f"Bulk quote request failed: {str(e)}")
+            return {}
+        
+        rows = data.get('data') if status == 200 else None
+        if not rows:
+            # Free keys get an 'Information' notice here; stop spending quota on it
+            if 'Information' in data:
+                self.bulk_quotes_supported = False
+            return {}
+        
+        quotes = {}
+        for row in rows:
+            symbol = row.get('symbol')
+            if symbol not in symbols:
+                continue
+            quote = {dst: str(row.get(src, '')) for src, dst in _BULK_QUOTE_FIELDS}
+            quote['07. latest trading day'] = str(row.get('timestamp', ''))[:10]
+            change_percent = str(row.get('change_percent', '0'))
+            quote['10. change percent'] = change_percent if change_percent.endswith('%') else change_percent + '%'
+            result = {'Global Quote': quote}
+            response_cache.set(
+                self.get_cache_key({'function': 'GLOBAL_QUOTE', 'symbol': symbol}), result, CACHE_TTLS['GLOBAL_QUOTE']
+            )
+            quotes[symbol] = result
+        return quotes
+
+    async def aclose(self):
+        """Close the aiohttp session, if one was opened"""
+        if self._aiohttp_session is not None:
+            await self._aiohttp_session.close()
+            self._aiohttp_session = None
+
     def _is_empty_response(self, data: Dict) -> bool:
         """Check if the API response is empty or invalid"""
         if 'Global Quote' in data:
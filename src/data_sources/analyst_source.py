@@ -15,7 +15,10 @@ class AnalystDataSource(DataSourceInterface):
     def connect(self) -> bool:
         """Load CSV data into DataFrame"""
         try:
-            self.df = pd.read_csv(self.csv_path)
+            df = pd.read_csv(self.csv_path, parse_dates=['analysis_date'])
+            # Index by symbol (keeping the column) so lookups are hash probes, not scans;
+            # the latest row wins if a symbol appears more than once
+            self.df = df.drop_duplicates('symbol', keep='last').set_index('symbol', drop=False).sort_index()
             return True
         except Exception as e:
             self.metadata.update_status(False, str(e))
@@ -42,12 +45,22 @@ class AnalystDataSource(DataSourceInterface):
         """Execute query on the DataFrame"""
         try:
             if 'symbol' in query:
-                result = self.df[self.df['symbol'] == query['symbol']]
-                if not result.empty:
-                    return result.iloc[0].to_dict()
-                return {'error': f"No data found for symbol {query['symbol']}"}
+                try:
+                    return self.df.loc[query['symbol']].to_dict()
+                except KeyError:
+                    return {'error': f"No data found for symbol {query['symbol']}"}
             else:
                 return {'error': "Query must include symbol"}
         except Exception as e:
             self.metadata.update_status(False, str(e))
-            return {'error': str(e)} 
\ No newline at end of file
+            return {'error': str(e)} 
+
+    def execute_query_many(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Look up several symbols in one pass, returning {symbol: row}"""
+        try:
+            # Intersect on the index rather than reindexing, so missing symbols
+            # don't introduce NaN rows that upcast the integer rating columns
+            return self.df.loc[self.df.index.intersection(symbols)].to_dict('index')
+        except Exception as e:
+            self.metadata.update_status(False, str(e))
+            return {}
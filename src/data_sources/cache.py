@@ -0,0 +1,100 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import orjson
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentCache:
+    """In-memory cache backed by SQLite, with writes flushed by a background thread"""
+
+    def __init__(self, path: str, default_ttl: int = 3600, flush_interval: float = 5.0):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.flush_interval = flush_interval  # Seconds new entries wait to share a commit
+        self._memory: Dict[str, Tuple[float, Any]] = {}
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Tuple[str, float, bytes]]]" = queue.Queue()
+        self._writer = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the cache database on first use; callers hold the lock"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS source_responses '
+                '(key TEXT PRIMARY KEY, expires_at REAL, payload BLOB)'
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                try:
+                    row = self._connect().execute(
+                        'SELECT expires_at, payload FROM source_responses WHERE key = ?', (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.error("Error reading cache: %s", e)
+                    return None
+                if row is None:
+                    return None
+                entry = (row[0], orjson.loads(row[1]))
+                self._memory[key] = entry
+        if entry[0] < now:
+            return None
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """Store value for ttl seconds; the disk write happens off the caller's thread"""
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='av-cache-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+        self._queue.put((key, expires_at, orjson.dumps(value)))
+
+    def _write_loop(self):
+        """Persist queued entries, committing at most once per flush interval"""
+        while True:
+            item = self._queue.get()
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None:
+                batch.append(item)
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                with self._lock:
+                    try:
+                        conn = self._connect()
+                        conn.executemany(
+                            'INSERT OR REPLACE INTO source_responses (key, expires_at, payload) VALUES (?, ?, ?)',
+                            batch
+                        )
+                        conn.commit()
+                    except sqlite3.Error as e:
+                        logger.error("Error saving cache: %s", e)
+            if item is None:
+                return
+
+    def close(self):
+        """Flush pending writes and stop the writer thread"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
@@ -1,11 +1,18 @@
 from typing import Dict, List
 from .base import DataSourceInterface
+from concurrent.futures import ThreadPoolExecutor, wait
 import logging
+import time
+
+# Healthy results are reused for this long before a source is probed again
+HEALTH_CHECK_TTL = 30
+HEALTH_CHECK_TIMEOUT = 5
 
 class DataSourceManager:
     def __init__(self):
         self.sources: Dict[str, DataSourceInterface] = {}
         self.logger = logging.getLogger(__name__)
+        self._last_healthy_at: Dict[str, float] = {}
 
     def register_source(self, source: DataSourceInterface) -> bool:
         """Register a new data source"""
@@ -27,6 +34,7 @@ class DataSourceManager:
             source = self.sources[source_name]
             source.disconnect()
             del self.sources[source_name]
+            self._last_healthy_at.pop(source_name, None)
             self.logger.info(f"Removed data source: {source_name}")
             return True
         return False
@@ -47,8 +55,28 @@ class DataSourceManager:
         return combined_schema
 
     def health_check_all(self) -> Dict[str, bool]:
-        """Check health of all data sources"""
-        return {name: source.health_check() for name, source in self.sources.items()}
+        """Check health of all data sources concurrently"""
+        now = time.monotonic()
+        stale = {
+            name: source for name, source in self.sources.items()
+            if now - self._last_healthy_at.get(name, float('-inf')) >= HEALTH_CHECK_TTL
+        }
+        results = {}
+        if stale:
+            # Wall time is bounded by the slowest probe (or the timeout), not their sum
+            executor = ThreadPoolExecutor(max_workers=len(stale))
+            futures = {name: executor.submit(source.health_check) for name, source in stale.items()}
+            wait(futures.values(), timeout=HEALTH_CHECK_TIMEOUT)
+            executor.shutdown(wait=False)
+            for name, future in futures.items():
+                try:
+                    results[name] = future.done() and future.result()
+                except Exception as e:
+                    self.logger.error(f"Health check failed for {name}: {str(e)}")
+                    results[name] = False
+                if results[name]:
+                    self._last_healthy_at[name] = time.monotonic()
+        return {name: results.get(name, True) for name in self.sources}
 
     def cleanup(self):
         """Cleanup all data source connections"""
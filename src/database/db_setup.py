@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Float, Integer
+from sqlalchemy import create_engine, event, Column, String, DateTime, Float, Integer, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from datetime import datetime
 import os
 
@@ -43,18 +43,45 @@ class Stock(Base):
     dcf_score = Column(Float, nullable=True)
     total_score = Column(Float, nullable=True)
 
+    # Covering index for the /stocks listing so it can be served from the index alone
+    __table_args__ = (
+        Index('idx_stocks_listing', 'symbol', 'current_price', 'pe_ratio', 'roe', 'total_score'),
+    )
+
     def __repr__(self):
         return f"<Stock(symbol='{self.symbol}')>"
 
-# Create database engine
+# Create database engine with an explicitly sized, self-healing connection pool
 DATABASE_URL = "sqlite:///stocks.db"
-engine = create_engine(DATABASE_URL)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 30},
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    query_cache_size=1200  # Room for every compiled statement shape the app and CLI use
+)
+
+# WAL lets readers run alongside the single writer and, with synchronous=NORMAL,
+# syncs at checkpoints instead of on every commit. A pooled engine is kept rather
+# than StaticPool, which would share one connection across request threads.
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.close()
 
 # Create all tables
 Base.metadata.create_all(engine)
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create session factory; sessions are scoped to the current thread so a web
+# request reuses one session until the app calls SessionLocal.remove()
+SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
 # Dependency to get DB session
 def get_db():
@@ -1,36 +1,161 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
 import asyncio
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.valuation import dcf_factor
+
+# Simple DCF assumptions: 5 years of 5% growth discounted at 10%. The sum of the
+# yearly growth/discount factors is constant, so a DCF value is eps * DCF_COEF
+DCF_COEF = dcf_factor(0.05, 0.10, 5)
+
+# Field tables for _merge_data: (source key, coerce, merged key, default)
+_MARKET_FIELDS = (
+    ('05. price', float, 'price', 0),
+    ('06. volume', int, 'volume', 0),
+    ('03. high', float, 'high', 0),
+    ('04. low', float, 'low', 0),
+    ('10. change percent', str, 'change_percent', '0%')
+)
+_FUNDAMENTAL_FIELDS = (
+    ('PERatio', float, 'pe_ratio', 0),
+    ('ReturnOnEquityTTM', float, 'roe', 0),
+    ('EPS', float, 'eps', 0),
+    ('ProfitMargin', float, 'profit_margin', 0)
+)
+# Analyst values are copied as-is: (source key, merged key)
+_RATING_FIELDS = (
+    ('analyst_ratings_strong_buy', 'strong_buy'),
+    ('analyst_ratings_buy', 'buy'),
+    ('analyst_ratings_hold', 'hold'),
+    ('analyst_ratings_sell', 'sell'),
+    ('analyst_ratings_strong_sell', 'strong_sell')
+)
+_TECHNICAL_FIELDS = ('rsi', 'macd', 'volatility', 'sentiment_score', 'beta')
+
+class TTLCache:
+    """
+    Thread-safe LRU mapping of at most maxsize entries, each expiring ttl seconds after it is stored
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def __setitem__(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
 
 class DataIntegrationSystem:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.cached_data = {}
-        self.cache_timestamp = {}
         self.cache_duration = 3600  # 1 hour cache
+        # Bounded so long-running processes don't grow without limit
+        self._cache = TTLCache(maxsize=4096, ttl=self.cache_duration)
+        # One pool for blocking source queries, kept for the system's lifetime
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='integration')
+        
+    async def integrate_many(self,
+                             symbols: List[str],
+                             alpha_vantage_source,
+                             analyst_source) -> Dict[str, Dict[str, Any]]:
+        """
+        Integrate data for several symbols concurrently, returning {symbol: data}
+        """
+        symbols = list(dict.fromkeys(symbols))
+        results = {}
+        pending = []
+        for symbol in symbols:
+            cached = self._cache.get(symbol)
+            if cached is not None:
+                results[symbol] = cached
+            else:
+                pending.append(symbol)
         
+        # One lookup for every symbol's analyst row instead of a scan per symbol;
+        # without an analyst source the symbols are scored on market data alone
+        analyst_rows = analyst_source.execute_query_many(pending) if (pending and analyst_source is not None) else {}
+        
+        # The Alpha Vantage rate limiter is process-wide, so all tasks share its budget;
+        # every symbol in the batch is stamped with the same snapshot time
+        last_updated = datetime.now().isoformat()
+        collected = await asyncio.gather(
+            *(self._collect_stock_data(symbol, alpha_vantage_source, analyst_source,
+                                       analyst_rows.get(symbol, {}), last_updated)
+              for symbol in pending),
+            return_exceptions=True
+        )
+        
+        merged = []
+        for symbol, data in zip(pending, collected):
+            if isinstance(data, Exception):
+                self.logger.error(f"Error integrating data for {symbol}: {str(data)}")
+                results[symbol] = {"error": str(data)}
+            else:
+                merged.append((symbol, data))
+        
+        if merged:
+            # Score the whole batch in one set of array operations
+            fundamentals = [data.get('fundamental_data', {}) for _, data in merged]
+            scores = self._calculate_buffet_scores_batch(
+                np.array([f.get('eps', 0) for f in fundamentals], dtype=float),
+                np.array([f.get('pe_ratio', 0) for f in fundamentals], dtype=float),
+                np.array([f.get('roe', 0) for f in fundamentals], dtype=float),
+                np.array([data.get('market_data', {}).get('price', 0) for _, data in merged], dtype=float)
+            )
+            rows = zip(*(values.tolist() for values in scores.values()))
+            for (symbol, data), row in zip(merged, rows):
+                data['buffet_analysis'] = dict(zip(scores.keys(), row))
+                self._cache_data(symbol, data)
+                results[symbol] = data
+        
+        return {symbol: results[symbol] for symbol in symbols}
+
     async def integrate_stock_data(self, 
                                  symbol: str,
                                  alpha_vantage_source,
-                                 analyst_source) -> Dict[str, Any]:
+                                 analyst_source,
+                                 analyst_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Integrate data from multiple sources for a given stock symbol
+        (analyst_data may be passed in when it was already looked up)
         """
         try:
             # Check cache first
-            if self._is_cache_valid(symbol):
+            cached = self._cache.get(symbol)
+            if cached is not None:
                 self.logger.info(f"Using cached data for {symbol}")
-                return self.cached_data[symbol]
+                return cached
 
-            # Gather data from all sources concurrently
-            financial_data = await self._get_financial_data(symbol, alpha_vantage_source)
-            analyst_data = await self._get_analyst_data(symbol, analyst_source)
-            
-            # Integrate the data
-            integrated_data = self._merge_data(symbol, financial_data, analyst_data)
+            integrated_data = await self._collect_stock_data(
+                symbol, alpha_vantage_source, analyst_source, analyst_data
+            )
             
             # Calculate Buffet criteria scores
             scores = self._calculate_buffet_scores(integrated_data)
@@ -45,6 +170,51 @@ class DataIntegrationSystem:
             self.logger.error(f"Error integrating data for {symbol}: {str(e)}")
             return {"error": str(e)}
 
+    async def _collect_stock_data(self,
+                                  symbol: str,
+                                  alpha_vantage_source,
+                                  analyst_source,
+                                  analyst_data: Optional[Dict[str, Any]] = None,
+                                  last_updated: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Fetch and merge source data for a symbol, without scoring
+        """
+        financial_data = self._cached_financial_data(symbol, alpha_vantage_source)
+        analyst_df = getattr(analyst_source, 'df', None)
+        if financial_data is not None and analyst_data is None and analyst_df is not None and symbol in analyst_df.index:
+            # Everything is already in memory: look it up directly, with no task or executor hop
+            analyst_data = analyst_source.execute_query({'symbol': symbol})
+        
+        # Gather whatever is still missing
+        if financial_data is None:
+            financial_data = await self._get_financial_data(symbol, alpha_vantage_source)
+        if analyst_data is None:
+            analyst_data = await self._get_analyst_data(symbol, analyst_source)
+        
+        # Integrate the data
+        return self._merge_data(symbol, financial_data, analyst_data, last_updated)
+
+    def _financial_queries(self, symbol: str) -> Dict[str, Dict[str, str]]:
+        """
+        Alpha Vantage queries behind each section of the financial data
+        """
+        return {
+            'market_data': {'function': 'GLOBAL_QUOTE', 'symbol': symbol},
+            'company_overview': {'function': 'OVERVIEW', 'symbol': symbol}
+        }
+
+    def _cached_financial_data(self, symbol: str, alpha_vantage_source) -> Optional[Dict[str, Any]]:
+        """
+        Financial data served entirely from the source's cache, or None on any miss
+        """
+        results = {}
+        for name, query in self._financial_queries(symbol).items():
+            cached = alpha_vantage_source.get_cached(query)
+            if cached is None:
+                return None
+            results[name] = cached
+        return results
+
     async def _get_financial_data(self, 
                                 symbol: str, 
                                 alpha_vantage_source) -> Dict[str, Any]:
@@ -52,24 +222,25 @@ class DataIntegrationSystem:
         Get financial data from Alpha Vantage
         """
         try:
-            # Execute queries concurrently
-            tasks = [
-                self._execute_query(alpha_vantage_source, {
-                    'function': 'GLOBAL_QUOTE',
-                    'symbol': symbol
-                }),
-                self._execute_query(alpha_vantage_source, {
-                    'function': 'OVERVIEW',
-                    'symbol': symbol
-                })
-            ]
-            
-            results = await asyncio.gather(*tasks)
+            # Serve fresh cache entries directly; each function has its own TTL, so
+            # usually only the short-lived quote needs a request
+            results = {}
+            pending = {}
+            for name, query in self._financial_queries(symbol).items():
+                cached = alpha_vantage_source.get_cached(query)
+                if cached is not None:
+                    results[name] = cached
+                else:
+                    pending[name] = query
             
-            return {
-                'market_data': results[0],
-                'company_overview': results[1]
-            }
+            # The remaining calls share the source's aiohttp session and run concurrently
+            if pending:
+                fetched = await asyncio.gather(
+                    *(alpha_vantage_source.aexecute_query(query) for query in pending.values())
+                )
+                results.update(zip(pending, fetched))
+            
+            return results
             
         except Exception as e:
             self.logger.error(f"Error fetching financial data: {str(e)}")
@@ -91,21 +262,28 @@ class DataIntegrationSystem:
                            source, 
                            query: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Execute query asynchronously
+        Execute a blocking query on the shared executor
         """
-        with ThreadPoolExecutor() as executor:
-            return await asyncio.get_event_loop().run_in_executor(
-                executor,
-                source.execute_query,
-                query
-            )
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            source.execute_query,
+            query
+        )
+
+    def close(self):
+        """
+        Shut down the shared executor
+        """
+        self._executor.shutdown(wait=True)
 
     def _merge_data(self, 
                     symbol: str,
                     financial_data: Dict[str, Any],
-                    analyst_data: Dict[str, Any]) -> Dict[str, Any]:
+                    analyst_data: Dict[str, Any],
+                    last_updated: Optional[str] = None) -> Dict[str, Any]:
         """
         Merge data from different sources
+        (batch callers pass one last_updated timestamp for the whole snapshot)
         """
         try:
             # Extract market data
@@ -114,41 +292,24 @@ class DataIntegrationSystem:
             
             merged_data = {
                 'symbol': symbol,
-                'last_updated': datetime.now().isoformat(),
+                'last_updated': last_updated or datetime.now().isoformat(),
                 
                 # Market Data
                 'market_data': {
-                    'price': float(market_data.get('05. price', 0)),
-                    'volume': int(market_data.get('06. volume', 0)),
-                    'high': float(market_data.get('03. high', 0)),
-                    'low': float(market_data.get('04. low', 0)),
-                    'change_percent': market_data.get('10. change percent', '0%')
+                    dst: coerce(market_data.get(src, default))
+                    for src, coerce, dst, default in _MARKET_FIELDS
                 },
                 
                 # Fundamental Data
                 'fundamental_data': {
-                    'pe_ratio': float(overview_data.get('PERatio', 0)),
-                    'roe': float(overview_data.get('ReturnOnEquityTTM', 0)),
-                    'eps': float(overview_data.get('EPS', 0)),
-                    'profit_margin': float(overview_data.get('ProfitMargin', 0))
+                    dst: coerce(overview_data.get(src, default))
+                    for src, coerce, dst, default in _FUNDAMENTAL_FIELDS
                 },
                 
                 # Analyst Data
                 'analyst_data': {
-                    'ratings': {
-                        'strong_buy': analyst_data.get('analyst_ratings_strong_buy', 0),
-                        'buy': analyst_data.get('analyst_ratings_buy', 0),
-                        'hold': analyst_data.get('analyst_ratings_hold', 0),
-                        'sell': analyst_data.get('analyst_ratings_sell', 0),
-                        'strong_sell': analyst_data.get('analyst_ratings_strong_sell', 0)
-                    },
-                    'technical_indicators': {
-                        'rsi': analyst_data.get('rsi', 0),
-                        'macd': analyst_data.get('macd', 0),
-                        'volatility': analyst_data.get('volatility', 0),
-                        'sentiment_score': analyst_data.get('sentiment_score', 0),
-                        'beta': analyst_data.get('beta', 0)
-                    }
+                    'ratings': {dst: analyst_data.get(src, 0) for src, dst in _RATING_FIELDS},
+                    'technical_indicators': {key: analyst_data.get(key, 0) for key in _TECHNICAL_FIELDS}
                 }
             }
             
@@ -175,13 +336,7 @@ class DataIntegrationSystem:
             roe_score = roe / 100 if roe > 0 else 0
             
             # Simple DCF calculation (simplified for demonstration)
-            eps = fundamental_data.get('eps', 0)
-            growth_rate = 0.05  # Assumed 5% growth
-            discount_rate = 0.10  # Assumed 10% discount rate
-            
-            dcf_value = 0
-            for year in range(1, 6):
-                dcf_value += (eps * (1 + growth_rate) ** year) / (1 + discount_rate) ** year
+            dcf_value = fundamental_data.get('eps', 0) * DCF_COEF
             
             dcf_score = (dcf_value - current_price) / current_price if current_price > 0 else 0
             
@@ -199,25 +354,41 @@ class DataIntegrationSystem:
             self.logger.error(f"Error calculating Buffet scores: {str(e)}")
             return {}
 
+    def _calculate_buffet_scores_batch(self,
+                                       eps: np.ndarray,
+                                       pe_ratio: np.ndarray,
+                                       roe: np.ndarray,
+                                       price: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Vectorised _calculate_buffet_scores over aligned per-symbol arrays
+        """
+        pe_score = np.divide(1.0, pe_ratio, out=np.zeros_like(pe_ratio), where=pe_ratio > 0)
+        roe_score = np.where(roe > 0, roe / 100, 0.0)
+        dcf_value = eps * DCF_COEF
+        dcf_score = np.divide(dcf_value - price, price, out=np.zeros_like(price), where=price > 0)
+        total_score = pe_score + roe_score + dcf_score
+        
+        return {
+            'pe_score': np.round(pe_score, 2),
+            'roe_score': np.round(roe_score, 2),
+            'dcf_score': np.round(dcf_score, 2),
+            'total_score': np.round(total_score, 2)
+        }
+
     def _is_cache_valid(self, symbol: str) -> bool:
         """
         Check if cached data is still valid
         """
-        if symbol not in self.cache_timestamp:
-            return False
-            
-        elapsed = (datetime.now() - self.cache_timestamp[symbol]).total_seconds()
-        return elapsed < self.cache_duration
+        return symbol in self._cache
 
     def _cache_data(self, symbol: str, data: Dict[str, Any]):
         """
         Cache integrated data
         """
-        self.cached_data[symbol] = data
-        self.cache_timestamp[symbol] = datetime.now()
+        self._cache[symbol] = data
 
     def get_cached_data(self, symbol: str) -> Optional[Dict[str, Any]]:
         """
         Get cached data for a symbol
         """
-        return self.cached_data.get(symbol) if self._is_cache_valid(symbol) else None 
\ No newline at end of file
+        return self._cache.get(symbol)
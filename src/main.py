@@ -1,27 +1,44 @@
 from database.db_setup import SessionLocal, Stock
-from utils.alpha_vantage import AlphaVantageAPI
+from sqlalchemy import select
+from utils.alpha_vantage import AlphaVantageAPI, CacheMissError, TransientAPIError
 import re
 import os
+import csv
+import sys
+from operator import itemgetter
 from dotenv import load_dotenv
 from utils.csv_loader import AnalystDataLoader
 from data_sources.manager import DataSourceManager
 from data_sources.alpha_vantage_source import AlphaVantageSource
 from data_sources.analyst_source import AnalystDataSource
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterable
 from integration.integration_system import DataIntegrationSystem
 import asyncio
 import logging
-import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
+# Compiled once; \Z (unlike $) also rejects a trailing newline
+_SYMBOL_RE = re.compile(r'^[A-Z]{1,5}\Z')
+_UPPER_ASCII = bytes(range(0x41, 0x5B))  # b'A'..b'Z', deleted by bytes.translate in _validate_symbol_format
+
+# Tickers accepted without asking Alpha Vantage, one per line
+TICKERS_FILE = os.getenv('TICKERS_FILE', os.path.join(os.path.dirname(__file__), '..', 'data', 'tickers.txt'))
+
+def load_known_tickers(path: str = TICKERS_FILE) -> frozenset:
+    """Load the local ticker catalog, or an empty set if it's missing"""
+    try:
+        with open(path) as f:
+            return frozenset(f.read().split())
+    except OSError:
+        return frozenset()
+
 def validate_stock_symbol(symbol):
     """
     Validate stock symbol format (1-5 uppercase letters)
     """
-    pattern = r'^[A-Z]{1,5}$'
-    return bool(re.match(pattern, symbol))
+    return _SYMBOL_RE.match(symbol) is not None
 
 def add_stock_symbols():
     db = SessionLocal()
@@ -29,6 +46,7 @@ def add_stock_symbols():
     print("Enter stock symbols (1-5 uppercase letters, e.g., AAPL)")
     print("Enter 'done' when finished\n")
     
+    pending = []
     while True:
         symbol = input("Enter stock symbol: ").strip().upper()
         
@@ -38,76 +56,105 @@ def add_stock_symbols():
         if not validate_stock_symbol(symbol):
             print("Invalid symbol format. Please enter 1-5 uppercase letters.")
             continue
-            
+        
+        if symbol in pending:
+            print(f"Symbol {symbol} already entered.")
+            continue
+        pending.append(symbol)
+    
+    if pending:
         try:
-            # Check if symbol already exists
-            existing_stock = db.query(Stock).filter(Stock.symbol == symbol).first()
-            if existing_stock:
-                print(f"Symbol {symbol} already exists in database.")
-                continue
-                
-            # Add new stock to database
-            new_stock = Stock(symbol=symbol)
-            db.add(new_stock)
+            # One existence check and one commit for the whole batch
+            existing = set(db.execute(select(Stock.symbol).where(Stock.symbol.in_(pending))).scalars())
+            for symbol in pending:
+                if symbol in existing:
+                    print(f"Symbol {symbol} already exists in database.")
+            new_symbols = [symbol for symbol in pending if symbol not in existing]
+            db.add_all([Stock(symbol=symbol) for symbol in new_symbols])
             db.commit()
-            print(f"Added {symbol} to database.")
-            
+            for symbol in new_symbols:
+                print(f"Added {symbol} to database.")
+                
         except Exception as e:
             db.rollback()
-            print(f"Error adding symbol {symbol}: {str(e)}")
+            print(f"Error adding symbols {', '.join(pending)}: {str(e)}")
     
     # Display all stored symbols
-    stocks = db.query(Stock).all()
+    symbols = db.execute(select(Stock.symbol)).scalars()
     print("\nStored stock symbols:")
-    for stock in stocks:
-        print(f"- {stock.symbol}")
+    for symbol in symbols:
+        print(f"- {symbol}")
     
     db.close()
 
 def update_stock_metrics():
     """Fetch and update financial metrics for all stocks in database"""
-    if not os.getenv('ALPHA_VANTAGE_API_KEY'):
+    api = AlphaVantageAPI()
+    # Offline mode serves demo data and never calls the API, so it needs no key
+    if not os.getenv('ALPHA_VANTAGE_API_KEY') and not api.offline:
+        api.close()
         print("\nError: Alpha Vantage API key not found!")
         print("Please create a .env file with your API key as ALPHA_VANTAGE_API_KEY=your_key_here")
         return
         
     db = SessionLocal()
-    api = AlphaVantageAPI()
-    
-    print("\nFetching financial metrics for stored stocks...")
-    stocks = db.query(Stock).all()
-    
-    for stock in stocks:
-        print(f"\nProcessing {stock.symbol}...")
-        metrics = api.get_all_metrics(stock.symbol)
+    try:
+        print("\nFetching financial metrics for stored stocks...")
+        stocks = db.query(Stock).all()
         
-        if metrics:
-            # Update stock with new metrics
-            for key, value in metrics.items():
-                setattr(stock, key, value)
+        # Requests overlap on the wire; AlphaVantageAPI's shared token bucket still
+        # paces them to the plan's rate limit
+        fetched = api.get_all_metrics_batch([stock.symbol for stock in stocks])
+        
+        changed = False
+        for stock in stocks:
+            metrics = fetched[stock.symbol]
+            print(f"\nProcessing {stock.symbol}...")
+            if isinstance(metrics, (TransientAPIError, CacheMissError)):
+                print(f"Skipping {stock.symbol}, Alpha Vantage unavailable: {metrics}")
+                continue
+            if isinstance(metrics, Exception):
+                print(f"Failed to fetch metrics for {stock.symbol}: {metrics}")
+                continue
             
+            if metrics:
+                # Update stock with new metrics, leaving unchanged columns clean
+                for key, value in metrics.items():
+                    if getattr(stock, key) != value:
+                        setattr(stock, key, value)
+                        changed = True
+                
+                print(f"Updated metrics for {stock.symbol}")
+                print(f"Current Price: ${metrics['current_price']:.2f}")
+                print(f"P/E Ratio: {metrics['pe_ratio']:.2f}")
+                print(f"ROE: {metrics['roe']:.2f}%")
+            else:
+                print(f"Failed to fetch metrics for {stock.symbol}")
+        
+        # One transaction for the whole refresh, skipped when nothing changed
+        if changed:
             db.commit()
-            print(f"Updated metrics for {stock.symbol}")
-            print(f"Current Price: ${metrics['current_price']:.2f}")
-            print(f"P/E Ratio: {metrics['pe_ratio']:.2f}")
-            print(f"ROE: {metrics['roe']:.2f}%")
-            print(f"DCF Value: ${metrics['dcf']:.2f}")
-            print(f"Total Buffet Score: {metrics['total_score']:.2f}")
-        else:
-            print(f"Failed to fetch metrics for {stock.symbol}")
-    
-    # Display ranked stocks
-    print("\nStocks ranked by Buffet Score:")
-    ranked_stocks = db.query(Stock).order_by(Stock.total_score.desc()).all()
-    
-    for i, stock in enumerate(ranked_stocks, 1):
-        print(f"\n{i}. {stock.symbol}")
-        print(f"   Total Score: {stock.total_score:.2f}")
-        print(f"   P/E Score: {stock.pe_score:.2f}")
-        print(f"   ROE Score: {stock.roe_score:.2f}")
-        print(f"   DCF Score: {stock.dcf_score:.2f}")
-    
-    db.close()
+        
+        # Display ranked stocks; scores stay NULL until the web app has scored a stock
+        print("\nStocks ranked by Buffet Score:")
+        ranked_stocks = db.execute(
+            select(Stock.symbol, Stock.total_score, Stock.pe_score, Stock.roe_score, Stock.dcf_score)
+            .order_by(Stock.total_score.desc())
+        ).all()
+        
+        for i, stock in enumerate(ranked_stocks, 1):
+            print(f"\n{i}. {stock.symbol}")
+            print(f"   Total Score: {_format_score(stock.total_score)}")
+            print(f"   P/E Score: {_format_score(stock.pe_score)}")
+            print(f"   ROE Score: {_format_score(stock.roe_score)}")
+            print(f"   DCF Score: {_format_score(stock.dcf_score)}")
+    finally:
+        api.close()
+        db.close()
+
+def _format_score(score):
+    """Two-decimal score, or N/A for stocks that haven't been scored yet"""
+    return 'N/A' if score is None else f"{score:.2f}"
 
 def load_analyst_data():
     """Load and sync analyst data from CSV file"""
@@ -122,63 +169,119 @@ def load_analyst_data():
 def display_complete_analysis():
     """Display complete analysis including both financial and analyst metrics"""
     db = SessionLocal()
-    stocks = db.query(Stock).all()
+    # Read-only report: fetch plain rows of just the displayed columns
+    stocks = db.execute(select(
+        Stock.symbol, Stock.pe_ratio, Stock.roe, Stock.current_price,
+        Stock.analyst_ratings_strong_buy, Stock.analyst_ratings_buy, Stock.analyst_ratings_hold,
+        Stock.analyst_ratings_sell, Stock.analyst_ratings_strong_sell,
+        Stock.rsi, Stock.macd, Stock.volatility, Stock.sentiment_score, Stock.beta,
+        Stock.pe_score, Stock.roe_score, Stock.dcf_score, Stock.total_score
+    )).all()
     
-    print("\nComplete Stock Analysis:")
+    # Build the whole report and write it in one go
+    out = ["\nComplete Stock Analysis:\n"]
     for stock in stocks:
-        print(f"\n{stock.symbol}")
-        print("Financial Metrics:")
-        print(f"  P/E Ratio: {stock.pe_ratio:.2f}")
-        print(f"  ROE: {stock.roe:.2f}%")
-        print(f"  Current Price: ${stock.current_price:.2f}")
-        
-        print("\nAnalyst Metrics:")
-        print(f"  Strong Buy: {stock.analyst_ratings_strong_buy}")
-        print(f"  Buy: {stock.analyst_ratings_buy}")
-        print(f"  Hold: {stock.analyst_ratings_hold}")
-        print(f"  Sell: {stock.analyst_ratings_sell}")
-        print(f"  Strong Sell: {stock.analyst_ratings_strong_sell}")
-        
-        print("\nTechnical Indicators:")
-        print(f"  RSI: {stock.rsi:.2f}")
-        print(f"  MACD: {stock.macd:.2f}")
-        print(f"  Volatility: {stock.volatility:.3f}")
-        print(f"  Sentiment Score: {stock.sentiment_score:.2f}")
-        print(f"  Beta: {stock.beta:.2f}")
-        
-        print("\nBuffet Analysis Scores:")
-        print(f"  P/E Score: {stock.pe_score:.2f}")
-        print(f"  ROE Score: {stock.roe_score:.2f}")
-        print(f"  DCF Score: {stock.dcf_score:.2f}")
-        print(f"  Total Score: {stock.total_score:.2f}")
+        out.append(
+            f"\n{stock.symbol}\n"
+            "Financial Metrics:\n"
+            f"  P/E Ratio: {stock.pe_ratio:.2f}\n"
+            f"  ROE: {stock.roe:.2f}%\n"
+            f"  Current Price: ${stock.current_price:.2f}\n"
+            "\nAnalyst Metrics:\n"
+            f"  Strong Buy: {stock.analyst_ratings_strong_buy}\n"
+            f"  Buy: {stock.analyst_ratings_buy}\n"
+            f"  Hold: {stock.analyst_ratings_hold}\n"
+            f"  Sell: {stock.analyst_ratings_sell}\n"
+            f"  Strong Sell: {stock.analyst_ratings_strong_sell}\n"
+            "\nTechnical Indicators:\n"
+            f"  RSI: {stock.rsi:.2f}\n"
+            f"  MACD: {stock.macd:.2f}\n"
+            f"  Volatility: {stock.volatility:.3f}\n"
+            f"  Sentiment Score: {stock.sentiment_score:.2f}\n"
+            f"  Beta: {stock.beta:.2f}\n"
+            "\nBuffet Analysis Scores:\n"
+            f"  P/E Score: {stock.pe_score:.2f}\n"
+            f"  ROE Score: {stock.roe_score:.2f}\n"
+            f"  DCF Score: {stock.dcf_score:.2f}\n"
+            f"  Total Score: {stock.total_score:.2f}\n"
+        )
+    sys.stdout.write(''.join(out))
         
     db.close()
 
 class BuffetAnalyzer:
+    # Columns shown in each table of the comparison, in display order
+    _COMPARISON_SECTIONS = (
+        ('Top Stocks by Buffet Criteria', ('symbol', 'total_score', 'pe_score', 'roe_score', 'dcf_score')),
+        ('Fundamental Metrics', ('symbol', 'price', 'pe_ratio', 'roe')),
+        ('Analyst and Sentiment Metrics', ('symbol', 'analyst_buy_ratings', 'sentiment_score')),
+    )
+
+    # Sections of display_analysis: (heading, path into the data, ((label, key, template), ...))
+    _ANALYSIS_SECTIONS = (
+        ('Market Data', ('market_data',), (
+            ('Price', 'price', '${:.2f}'),
+            ('Change', 'change_percent', '{}'),
+            ('Volume', 'volume', '{:,}'),
+        )),
+        ('Fundamental Analysis', ('fundamental_data',), (
+            ('P/E Ratio', 'pe_ratio', '{:.2f}'),
+            ('ROE', 'roe', '{:.2f}%'),
+            ('EPS', 'eps', '${:.2f}'),
+        )),
+        ('Analyst Ratings', ('analyst_data', 'ratings'), (
+            ('Strong Buy', 'strong_buy', '{}'),
+            ('Buy', 'buy', '{}'),
+            ('Hold', 'hold', '{}'),
+            ('Sell', 'sell', '{}'),
+            ('Strong Sell', 'strong_sell', '{}'),
+        )),
+        ('Technical Indicators', ('analyst_data', 'technical_indicators'), (
+            ('RSI', 'rsi', '{:.2f}'),
+            ('MACD', 'macd', '{:.2f}'),
+            ('Volatility', 'volatility', '{:.3f}'),
+            ('Sentiment', 'sentiment_score', '{:.2f}'),
+            ('Beta', 'beta', '{:.2f}'),
+        )),
+        ('Buffet Analysis', ('buffet_analysis',), (
+            ('P/E Score', 'pe_score', '{:.2f}'),
+            ('ROE Score', 'roe_score', '{:.2f}'),
+            ('DCF Score', 'dcf_score', '{:.2f}'),
+            ('Total Score', 'total_score', '{:.2f}'),
+        )),
+    )
+
     def __init__(self):
         self.manager = DataSourceManager()
         self.integration_system = DataIntegrationSystem()
         self.user_stocks = set()  # Store user's selected stocks
+        self._known = load_known_tickers()
         self.setup_data_sources()
 
     def setup_data_sources(self):
         alpha_vantage = AlphaVantageSource(api_key=os.getenv('ALPHA_VANTAGE_API_KEY'))
         analyst_data = AnalystDataSource(csv_path='analyst_data.csv')
         
-        self.manager.register_source(alpha_vantage)
-        self.manager.register_source(analyst_data)
+        # Keep direct references to the registered sources (None if registration failed)
+        self._av = alpha_vantage if self.manager.register_source(alpha_vantage) else None
+        self._analyst = analyst_data if self.manager.register_source(analyst_data) else None
+
+    async def close(self):
+        """Close the async HTTP session, integration executor and data source connections"""
+        if self._av:
+            await self._av.aclose()
+        self.integration_system.close()
+        self.manager.cleanup()
 
     async def validate_stock_symbol(self, symbol: str) -> bool:
         """Validate if stock symbol exists"""
-        alpha_vantage = self.manager.get_source("alpha_vantage")
-        return await alpha_vantage.validate_symbol(symbol)
+        return await self._av.validate_symbol(symbol)
 
     async def add_stocks(self):
         """Add stocks to analyze with improved validation"""
         print("\nEnter stock symbols to analyze (e.g., AAPL, MSFT, GOOGL)")
         print("Enter 'done' when finished")
         
-        alpha_vantage = self.manager.get_source("alpha_vantage")
         first_symbol = True
         
         while True:
@@ -191,8 +294,11 @@ class BuffetAnalyzer:
                 print("Invalid symbol format. Please use 1-5 uppercase letters.")
                 continue
 
-            # Validate symbol
-            is_valid, message = await alpha_vantage.validate_symbol(symbol)
+            # Validate symbol, skipping the API round-trip for catalogued tickers
+            if symbol in self._known:
+                is_valid, message = True, "Symbol found in local ticker catalog"
+            else:
+                is_valid, message = await self._av.validate_symbol(symbol)
             
             # On first symbol, show the validation method being used
             if first_symbol:
@@ -208,8 +314,9 @@ class BuffetAnalyzer:
         print("\nCurrent stocks for analysis:", ", ".join(sorted(self.user_stocks)))
 
     def _validate_symbol_format(self, symbol: str) -> bool:
-        """Validate stock symbol format"""
-        return bool(re.match(r'^[A-Z]{1,5}$', symbol))
+        """Validate stock symbol format (1-5 ASCII uppercase letters) without entering the regex engine"""
+        encoded = symbol.encode('ascii', 'ignore')
+        return 1 <= len(encoded) <= 5 and len(encoded) == len(symbol) and not encoded.translate(None, _UPPER_ASCII)
 
     def remove_stocks(self):
         """Remove stocks from analysis list"""
@@ -229,28 +336,6 @@ class BuffetAnalyzer:
         else:
             print(f"{symbol} not found in analysis list")
 
-    async def analyze_stock(self, symbol: str) -> Dict:
-        """Analyze a single stock with error handling"""
-        try:
-            alpha_vantage = self.manager.get_source("alpha_vantage")
-            analyst_source = self.manager.get_source("analyst_data")
-            
-            data = await self.integration_system.integrate_stock_data(
-                symbol,
-                alpha_vantage,
-                analyst_source
-            )
-            
-            if 'error' in data:
-                print(f"\nError analyzing {symbol}: {data['error']}")
-                return None
-                
-            return data
-            
-        except Exception as e:
-            print(f"\nError analyzing {symbol}: {str(e)}")
-            return None
-
     async def analyze_all_stocks(self):
         """Analyze all stocks in the list with error handling"""
         if not self.user_stocks:
@@ -261,13 +346,24 @@ class BuffetAnalyzer:
         results = []
         failed_symbols = []
         
-        for symbol in self.user_stocks:
-            print(f"\nAnalyzing {symbol}...")
-            data = await self.analyze_stock(symbol)
-            
+        # Quotes for the whole list come back in one bulk call and land in the source's
+        # cache, leaving only fundamentals for the per-symbol analyses
+        if self._av:
+            await self._av.fetch_batch(sorted(self.user_stocks))
+        
+        # Integrate the whole list in one batch: analyst rows are looked up together,
+        # Alpha Vantage fetches overlap within the source's adaptive concurrency
+        # limit and every symbol is scored in one vectorised pass
+        integrated = await self.integration_system.integrate_many(
+            sorted(self.user_stocks), self._av, self._analyst
+        )
+        
+        for symbol, data in integrated.items():
             if data and 'error' not in data:
                 results.append(self._extract_comparison_metrics(data))
             else:
+                if data:
+                    print(f"\nError analyzing {symbol}: {data['error']}")
                 failed_symbols.append(symbol)
         
         if failed_symbols:
@@ -300,28 +396,39 @@ class BuffetAnalyzer:
 
     def display_comparison(self, results: List[Dict]):
         """Display comparison of all analyzed stocks"""
-        df = pd.DataFrame(results)
-        
         # Sort by total Buffet score
-        df_sorted = df.sort_values('total_score', ascending=False)
-        
-        print("\n=== Stock Comparison (Sorted by Buffet Score) ===")
-        print("\nTop Stocks by Buffet Criteria:")
-        print(df_sorted[['symbol', 'total_score', 'pe_score', 'roe_score', 'dcf_score']].to_string(index=False))
+        results = sorted(results, key=itemgetter('total_score'), reverse=True)
         
-        print("\nFundamental Metrics:")
-        print(df_sorted[['symbol', 'price', 'pe_ratio', 'roe']].to_string(index=False))
-        
-        print("\nAnalyst and Sentiment Metrics:")
-        print(df_sorted[['symbol', 'analyst_buy_ratings', 'sentiment_score']].to_string(index=False))
+        # Format every cell once, then lay out each table from the same strings
+        cells = [
+            {key: f"{value:.2f}" if isinstance(value, float) else str(value) for key, value in row.items()}
+            for row in results
+        ]
+        lines = ["\n=== Stock Comparison (Sorted by Buffet Score) ==="]
+        for title, columns in self._COMPARISON_SECTIONS:
+            widths = [max(len(column), *(len(row[column]) for row in cells)) for column in columns]
+            lines.append(f"\n{title}:")
+            lines.append("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+            lines.extend(
+                "  ".join(row[column].rjust(width) for column, width in zip(columns, widths))
+                for row in cells
+            )
+        sys.stdout.write("\n".join(lines) + "\n")
         
         # Save detailed report
-        self.save_detailed_report(df_sorted)
+        self.save_detailed_report(results)
 
-    def save_detailed_report(self, df: pd.DataFrame):
-        """Save detailed analysis to CSV"""
+    def save_detailed_report(self, results: Iterable[Dict]):
+        """Save detailed analysis to CSV, writing rows as they are consumed"""
         filename = 'buffet_analysis_report.csv'
-        df.to_csv(filename, index=False)
+        rows = iter(results)
+        first = next(rows, None)
+        with open(filename, 'w', newline='') as f:
+            if first is not None:
+                writer = csv.DictWriter(f, fieldnames=list(first))
+                writer.writeheader()
+                writer.writerow(first)
+                writer.writerows(rows)
         print(f"\nDetailed report saved to {filename}")
 
     def display_detailed_analysis(self, symbol: str):
@@ -338,40 +445,14 @@ class BuffetAnalyzer:
             print(f"\nError: {data['error']}")
             return
 
-        print("\n=== Market Data ===")
-        market_data = data['market_data']
-        print(f"Price: ${market_data['price']:.2f}")
-        print(f"Change: {market_data['change_percent']}")
-        print(f"Volume: {market_data['volume']:,}")
-
-        print("\n=== Fundamental Analysis ===")
-        fundamental_data = data['fundamental_data']
-        print(f"P/E Ratio: {fundamental_data['pe_ratio']:.2f}")
-        print(f"ROE: {fundamental_data['roe']:.2f}%")
-        print(f"EPS: ${fundamental_data['eps']:.2f}")
-
-        print("\n=== Analyst Ratings ===")
-        ratings = data['analyst_data']['ratings']
-        print(f"Strong Buy: {ratings['strong_buy']}")
-        print(f"Buy: {ratings['buy']}")
-        print(f"Hold: {ratings['hold']}")
-        print(f"Sell: {ratings['sell']}")
-        print(f"Strong Sell: {ratings['strong_sell']}")
-
-        print("\n=== Technical Indicators ===")
-        tech = data['analyst_data']['technical_indicators']
-        print(f"RSI: {tech['rsi']:.2f}")
-        print(f"MACD: {tech['macd']:.2f}")
-        print(f"Volatility: {tech['volatility']:.3f}")
-        print(f"Sentiment: {tech['sentiment_score']:.2f}")
-        print(f"Beta: {tech['beta']:.2f}")
-
-        print("\n=== Buffet Analysis ===")
-        scores = data['buffet_analysis']
-        print(f"P/E Score: {scores['pe_score']:.2f}")
-        print(f"ROE Score: {scores['roe_score']:.2f}")
-        print(f"DCF Score: {scores['dcf_score']:.2f}")
-        print(f"Total Score: {scores['total_score']:.2f}")
+        lines = []
+        for heading, path, fields in self._ANALYSIS_SECTIONS:
+            section = data
+            for key in path:
+                section = section[key]
+            lines.append(f"\n=== {heading} ===")
+            lines.extend(f"{label}: {template.format(section[key])}" for label, key, template in fields)
+        sys.stdout.write("\n".join(lines) + "\n")
 
 async def main():
     analyzer = BuffetAnalyzer()
@@ -419,6 +500,8 @@ async def main():
             
         else:
             print("Invalid choice. Please try again.")
+    
+    await analyzer.close()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -1,33 +1,35 @@
-from typing import Dict, List, Any, Optional
-from difflib import SequenceMatcher
-import json
+from typing import Dict, List, Any, Optional, Tuple
+from rapidfuzz import fuzz, process
+import orjson
 import os
+import mmap
 from datetime import datetime
 import logging
 from abc import ABC, abstractmethod
 
 class SchemaField:
+    __slots__ = ('name', 'data_type', 'source', 'description', 'aliases', '_name_lower')
+
     def __init__(self, name: str, data_type: str, source: str, description: str = None):
         self.name = name
         self.data_type = data_type
         self.source = source
         self.description = description
+        self._name_lower = name.lower()
         self.aliases = self._generate_aliases()
         
-    def _generate_aliases(self) -> List[str]:
+    def _generate_aliases(self) -> Tuple[str, ...]:
         """Generate possible aliases for the field name"""
-        name_parts = self.name.lower().replace('_', ' ').split()
-        aliases = [self.name.lower()]
+        name_lower = self._name_lower
+        name_parts = name_lower.replace('_', ' ').split()
         
-        # Add common variations
-        if 'ratio' in name_parts:
-            aliases.append(self.name.lower().replace('ratio', 'r'))
-        if 'price' in name_parts:
-            aliases.append(self.name.lower().replace('price', 'p'))
-        if 'earnings' in name_parts:
-            aliases.append(self.name.lower().replace('earnings', 'e'))
-            
-        return aliases
+        # Each variation replaces a different word, so the entries are already distinct
+        return tuple(filter(None, (
+            name_lower,
+            name_lower.replace('ratio', 'r') if 'ratio' in name_parts else None,
+            name_lower.replace('price', 'p') if 'price' in name_parts else None,
+            name_lower.replace('earnings', 'e') if 'earnings' in name_parts else None,
+        )))
 
 class SchemaMapper:
     def __init__(self):
@@ -36,28 +38,52 @@ class SchemaMapper:
         self.field_mappings = {}
         self.mapping_history = []
         self.mapping_file = 'schema_mappings.json'
+        self._field_keys = None  # field_mappings key -> lowercased key, rebuilt lazily after inserts/deletes
+        self._reverse: Dict[Tuple[str, str], str] = {}  # (source, source field) -> unified name
+        self._mapping_mtime = None  # st_mtime_ns of the mapping file as last loaded or saved
         self.load_mappings()
 
     def load_mappings(self):
-        """Load existing mappings from file"""
+        """Load existing mappings from file, skipping the parse if it hasn't changed"""
         try:
             if os.path.exists(self.mapping_file):
-                with open(self.mapping_file, 'r') as f:
-                    saved_mappings = json.load(f)
-                    self.field_mappings = saved_mappings.get('mappings', {})
-                    self.mapping_history = saved_mappings.get('history', [])
+                mtime = os.stat(self.mapping_file).st_mtime_ns
+                if mtime == self._mapping_mtime:
+                    return
+                # Parse straight from the mapped pages rather than a read() copy
+                with open(self.mapping_file, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                        memoryview(mm) as view:
+                    saved_mappings = orjson.loads(view)
+                self.field_mappings = saved_mappings.get('mappings', {})
+                self.mapping_history = saved_mappings.get('history', [])
+                self._field_keys = None
+                self._build_reverse_index()
+                self._mapping_mtime = mtime
         except Exception as e:
             self.logger.error(f"Error loading mappings: {e}")
 
+    def _build_reverse_index(self):
+        """Rebuild the (source, source field) -> unified name index from field_mappings"""
+        self._reverse = {}
+        for unified_name, mapping in self.field_mappings.items():
+            for source_name, source_field in mapping['sources'].items():
+                self._reverse.setdefault((source_name, source_field['field_name']), unified_name)
+
     def save_mappings(self):
-        """Save current mappings to file"""
+        """Save current mappings to file, replacing it atomically"""
         try:
-            with open(self.mapping_file, 'w') as f:
-                json.dump({
-                    'mappings': self.field_mappings,
-                    'history': self.mapping_history,
-                    'last_updated': datetime.now().isoformat()
-                }, f, indent=2)
+            payload = orjson.dumps({
+                'mappings': self.field_mappings,
+                'history': self.mapping_history,
+                'last_updated': datetime.now().isoformat()
+            }, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            tmp_file = self.mapping_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(payload)
+            # A crash mid-write leaves the previous file intact
+            os.replace(tmp_file, self.mapping_file)
+            self._mapping_mtime = os.stat(self.mapping_file).st_mtime_ns
         except Exception as e:
             self.logger.error(f"Error saving mappings: {e}")
 
@@ -95,11 +121,15 @@ class SchemaMapper:
             similar_field = self._find_similar_field(field_name)
             
             if similar_field:
-                # Add to existing mapping
-                self.field_mappings[similar_field]['sources'][source_name] = {
+                # Add to existing mapping, replacing any field this source mapped there before
+                sources = self.field_mappings[similar_field]['sources']
+                if source_name in sources:
+                    self._reverse.pop((source_name, sources[source_name]['field_name']), None)
+                sources[source_name] = {
                     'field_name': field_name,
                     'info': field_info
                 }
+                self._reverse[(source_name, field_name)] = similar_field
             else:
                 # Create new mapping
                 self.field_mappings[field_name] = {
@@ -112,14 +142,17 @@ class SchemaMapper:
                     'type': field_info.get('type', 'string'),
                     'created_at': datetime.now().isoformat()
                 }
+                self._field_keys = None
+                self._reverse[(source_name, field_name)] = field_name
 
     def _find_similar_field(self, field_name: str, threshold: float = 0.8) -> Optional[str]:
-        """Find similar existing field names"""
-        for existing_field in self.field_mappings.keys():
-            similarity = SequenceMatcher(None, field_name.lower(), existing_field.lower()).ratio()
-            if similarity >= threshold:
-                return existing_field
-        return None
+        """Find the most similar existing field name"""
+        if self._field_keys is None:
+            self._field_keys = {name: name.lower() for name in self.field_mappings}
+        match = process.extractOne(
+            field_name.lower(), self._field_keys, scorer=fuzz.ratio, score_cutoff=threshold * 100
+        )
+        return None if match is None else match[2]
 
     def _cleanup_mappings(self, source_name: str):
         """Clean up mappings when a source is removed"""
@@ -134,19 +167,21 @@ class SchemaMapper:
         for field_name in list(self.field_mappings.keys()):
             sources = self.field_mappings[field_name]['sources']
             if source_name in sources:
+                self._reverse.pop((source_name, sources[source_name]['field_name']), None)
                 del sources[source_name]
                 if not sources:  # If no sources left, remove the field
                     del self.field_mappings[field_name]
+                    self._field_keys = None
 
     def get_field_mapping(self, source_name: str, field_name: str) -> Dict[str, Any]:
         """Get mapping for a specific field"""
-        for unified_name, mapping in self.field_mappings.items():
-            if source_name in mapping['sources'] and mapping['sources'][source_name]['field_name'] == field_name:
-                return {
-                    'unified_name': unified_name,
-                    'mapping': mapping
-                }
-        return None
+        unified_name = self._reverse.get((source_name, field_name))
+        if unified_name is None:
+            return None
+        return {
+            'unified_name': unified_name,
+            'mapping': self.field_mappings[unified_name]
+        }
 
     def handle_schema_change(self, source_name: str, new_schema: Dict[str, Any]):
         """Handle changes in source schema"""
@@ -164,20 +199,23 @@ class SchemaMapper:
         # Update schema
         self.source_schemas[source_name] = new_schema
         
+        # Key views diff directly without copying either schema into a set first
+        old_keys = old_schema.keys()
+        new_keys = new_schema.keys()
+        
         # Find removed fields
-        removed_fields = set(old_schema.keys()) - set(new_schema.keys())
-        for field in removed_fields:
+        for field in old_keys - new_keys:
             self._handle_removed_field(source_name, field)
         
         # Find new fields
-        new_fields = set(new_schema.keys()) - set(old_schema.keys())
-        for field in new_fields:
+        for field in new_keys - old_keys:
             self._map_field(source_name, field, new_schema[field])
             
         self.save_mappings()
 
     def _handle_removed_field(self, source_name: str, field_name: str):
         """Handle removal of a field from source"""
+        self._reverse.pop((source_name, field_name), None)
         for mapping in self.field_mappings.values():
             if source_name in mapping['sources'] and mapping['sources'][source_name]['field_name'] == field_name:
                 del mapping['sources'][source_name]
@@ -1,46 +1,176 @@
+import json
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import logging
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-import time
+from .rate_limiter import TokenBucket
+from .response_cache import ResponseCache
+from .valuation import dcf_factor
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Fundamentals change at most daily, so computed metrics are kept for 24 hours
+metrics_cache = ResponseCache(os.getenv('ALPHA_VANTAGE_CACHE', 'av_cache.sqlite'), ttl=86400)
+
+# Raw endpoint responses share the cache file; prices go stale sooner than fundamentals
+RESPONSE_TTLS = {
+    'TIME_SERIES_DAILY': 3600,
+    'OVERVIEW': 86400,
+    'INCOME_STATEMENT': 86400
+}
+# 'enabled' reads and writes the cache, 'replay' serves only cached responses
+# (a miss raises, so tests never touch the network) and 'disabled' bypasses it
+CACHE_MODES = ('enabled', 'replay', 'disabled')
+
+# Process-wide limiter shared by every AlphaVantageAPI instance and thread
+# (free tier allows 5 requests per minute; raise ALPHA_VANTAGE_RPM on paid plans)
+_requests_per_minute = float(os.getenv('ALPHA_VANTAGE_RPM', 5))
+_bucket = TokenBucket(rate=_requests_per_minute / 60, capacity=_requests_per_minute)
+
+# Known valid stocks with their demo data, served when the API is unavailable;
+# _get_demo_data hands out copies so callers can't alter the fallback values
+_DEMO_DATA = MappingProxyType({
+    'AAPL': {
+        'current_price': 181.45,
+        'high_price': 182.34,
+        'low_price': 180.17,
+        'pe_ratio': 28.5,
+        'roe': 45.0
+    },
+    'GOOGL': {
+        'current_price': 2789.61,
+        'high_price': 2800.12,
+        'low_price': 2775.89,
+        'pe_ratio': 25.8,
+        'roe': 30.5
+    },
+    'MSFT': {
+        'current_price': 378.92,
+        'high_price': 380.15,
+        'low_price': 377.23,
+        'pe_ratio': 32.4,
+        'roe': 42.7
+    },
+    'TSLA': {
+        'current_price': 262.67,
+        'high_price': 265.12,
+        'low_price': 260.89,
+        'pe_ratio': 75.2,
+        'roe': 25.3
+    }
+})
+
+def _safe_float(data, key, default=0.0):
+    """data[key] as a float, or default when it's missing or not numeric (e.g. 'None')"""
+    try:
+        return float(data[key])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+class TransientAPIError(Exception):
+    """Alpha Vantage is throttling or unreachable; the symbol itself may be valid"""
+    pass
+
+class CacheMissError(Exception):
+    """A response was requested in replay mode but isn't cached"""
+    pass
+
 class AlphaVantageAPI:
     def __init__(self):
         self.api_key = os.getenv('ALPHA_VANTAGE_API_KEY')
         self.base_url = 'https://www.alphavantage.co/query'
-        self.delay = 12  # Delay between API calls to respect rate limit (5 calls per minute)
+        self.cache_mode = os.getenv('ALPHA_VANTAGE_CACHE_MODE', 'enabled')
+        if self.cache_mode not in CACHE_MODES:
+            raise ValueError(f"ALPHA_VANTAGE_CACHE_MODE must be one of {', '.join(CACHE_MODES)}")
+        # Offline mode answers from the demo data only and never touches the network
+        self.offline = os.getenv('ALPHA_VANTAGE_OFFLINE') == '1'
+
+        # Shared session so concurrent fetches reuse pooled keep-alive connections.
+        # 5xx responses are retried with backoff inside the adapter; those retries
+        # don't pass through the token bucket. 429 is left to _get so throttling
+        # surfaces as TransientAPIError instead of spending more of the rate budget.
+        self.session = requests.Session()
+        retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        """Release the pooled connections"""
+        self.session.close()
+
+    def _get(self, params):
+        """Issue a rate-limited request and return the parsed JSON body"""
+        _bucket.acquire()
+        response = self.session.get(self.base_url, params=params)
+        if response.status_code == 429:
+            raise TransientAPIError("HTTP 429 Too Many Requests")
+        data = orjson.loads(response.content)
+        
+        # Alpha Vantage reports throttling in the body of a 200 response
+        throttle_message = data.get('Note') or data.get('Information')
+        if throttle_message:
+            raise TransientAPIError(throttle_message)
+        return data
+
+    def _cached_get(self, params, use_cache=True):
+        """
+        _get through the response cache, keyed on every parameter except the API key.
+        Error responses are returned but never cached. Replay mode never reaches the
+        network, so it reads the cache even when use_cache is False.
+        """
+        replay = self.cache_mode == 'replay'
+        if not replay and (self.cache_mode == 'disabled' or not use_cache):
+            return self._get(params)
+        
+        key = ResponseCache.make_key(
+            self.base_url, json.dumps({k: v for k, v in params.items() if k != 'apikey'}, sort_keys=True)
+        )
+        cached = metrics_cache.get(key)
+        if cached is not None:
+            return cached
+        if replay:
+            raise CacheMissError(f"No cached response for {params.get('function')} {params.get('symbol')}")
+        
+        data = self._get(params)
+        if 'Error Message' not in data:
+            metrics_cache.set(key, data, RESPONSE_TTLS.get(params.get('function')))
+        return data
 
-    def get_company_overview(self, symbol):
+    def get_company_overview(self, symbol, use_cache=True):
         """Get company overview including P/E ratio and ROE"""
         params = {
             'function': 'OVERVIEW',
             'symbol': symbol,
             'apikey': self.api_key
         }
-        response = requests.get(self.base_url, params=params)
-        time.sleep(self.delay)  # Respect API rate limit
-        data = response.json()
+        data = self._cached_get(params, use_cache)
         
         return {
-            'pe_ratio': float(data.get('PERatio', 0)),
-            'roe': float(data.get('ReturnOnEquityTTM', 0)) * 100  # Convert to percentage
+            'pe_ratio': _safe_float(data, 'PERatio'),
+            'roe': _safe_float(data, 'ReturnOnEquityTTM') * 100  # Convert to percentage
         }
 
-    def get_daily_prices(self, symbol):
+    def get_daily_prices(self, symbol, use_cache=True):
         """Get daily stock prices"""
         params = {
             'function': 'TIME_SERIES_DAILY',
             'symbol': symbol,
             'apikey': self.api_key
         }
-        response = requests.get(self.base_url, params=params)
-        time.sleep(self.delay)  # Respect API rate limit
-        data = response.json()
-        
-        # Get the most recent day's data
-        latest_day = list(data['Time Series (Daily)'].keys())[0]
-        daily_data = data['Time Series (Daily)'][latest_day]
+        return self._parse_daily_prices(self._cached_get(params, use_cache))
+
+    @staticmethod
+    def _parse_daily_prices(data):
+        """Extract the latest close/high/low from a TIME_SERIES_DAILY response"""
+        # The series is ordered newest first
+        daily_data = next(iter(data['Time Series (Daily)'].values()))
         
         return {
             'current_price': float(daily_data['4. close']),
@@ -48,7 +178,7 @@ class AlphaVantageAPI:
             'low_price': float(daily_data['3. low'])
         }
 
-    def calculate_dcf(self, symbol):
+    def calculate_dcf(self, symbol, use_cache=True):
         """
         Calculate a simple DCF value using available data
         Note: This is a simplified calculation for demonstration
@@ -59,65 +189,66 @@ class AlphaVantageAPI:
             'symbol': symbol,
             'apikey': self.api_key
         }
-        response = requests.get(self.base_url, params=params)
-        time.sleep(self.delay)  # Respect API rate limit
-        data = response.json()
+        data = self._cached_get(params, use_cache)
         
         try:
             # Get the most recent year's net income
             net_income = float(data['annualReports'][0]['netIncome'])
-            # Assume 5% growth rate for 5 years
-            growth_rate = 0.05
-            discount_rate = 0.10
-            
-            # Simple DCF calculation
-            dcf_value = 0
-            for year in range(1, 6):
-                projected_cash_flow = net_income * (1 + growth_rate) ** year
-                dcf_value += projected_cash_flow / (1 + discount_rate) ** year
-            
-            return dcf_value
+            # Assume 5% growth rate for 5 years, discounted at 10%
+            return net_income * dcf_factor(0.05, 0.10, 5)
         except (KeyError, IndexError, ValueError):
             return 0
 
-    def get_all_metrics(self, symbol):
-        """Get all required metrics for a stock"""
+    def get_all_metrics(self, symbol, use_cache=True):
+        """
+        Get all required metrics for a stock, served from the cache when fresh.
+        Returns None for unknown symbols and raises TransientAPIError when the
+        API is throttling or unreachable and no demo data exists.
+        With ALPHA_VANTAGE_OFFLINE=1 only the demo data is consulted, and symbols
+        without it raise TransientAPIError so callers skip rather than drop them.
+        """
+        if self.offline:
+            demo_data = self._get_demo_data(symbol)
+            if demo_data is None:
+                raise TransientAPIError(f"Offline mode has no demo data for {symbol}")
+            return demo_data
+        
+        cache_key = ResponseCache.make_key(self.base_url, 'metrics', symbol)
+        if use_cache and self.cache_mode != 'disabled':
+            cached = metrics_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Using cached metrics for %s", symbol)
+                return cached
+        
         try:
-            print(f"\nFetching metrics for {symbol}...")
-            print(f"API Key present: {'Yes' if self.api_key else 'No'}")
+            logger.debug("Fetching metrics for %s...", symbol)
+            logger.debug("API Key present: %s", 'Yes' if self.api_key else 'No')
             
-            # Check if we've hit the API rate limit
+            # The daily series doubles as the availability probe; throttling
+            # raises TransientAPIError from _get
             test_params = {
                 'function': 'TIME_SERIES_DAILY',
                 'symbol': symbol,
                 'apikey': self.api_key
             }
-            print("Testing API availability...")
-            response = requests.get(self.base_url, params=test_params)
-            data = response.json()
+            logger.debug("Testing API availability...")
+            data = self._cached_get(test_params, use_cache)
             
-            # Log the API response for debugging
-            print(f"API Response Status: {response.status_code}")
-            if 'Note' in data:
-                print(f"API Note: {data['Note']}")
-            if 'Error Message' in data:
-                print(f"API Error: {data['Error Message']}")
-            
-            # If we get any error or missing data, use demo data
-            if 'Note' in data or 'Error Message' in data or 'Time Series (Daily)' not in data:
-                print(f"API rate limit reached or error occurred. Using demo data for {symbol}...")
+            # An error message or missing series means the symbol is unknown
+            if 'Error Message' in data or 'Time Series (Daily)' not in data:
+                logger.warning("API Error for %s: %s", symbol, data.get('Error Message'))
                 demo_data = self._get_demo_data(symbol)
                 if demo_data:
-                    print(f"Using demo data for {symbol}")
+                    logger.debug("Using demo data for %s", symbol)
                     return demo_data
                 else:
-                    print(f"No demo data available for {symbol}")
+                    logger.debug("No demo data available for %s", symbol)
                     return None
             
-            print("Fetching real-time data...")
-            # If no rate limit, get real data
-            daily_prices = self.get_daily_prices(symbol)
-            company_data = self.get_company_overview(symbol)
+            logger.debug("Fetching real-time data...")
+            # Prices come from the probe response; only the overview needs another call
+            daily_prices = self._parse_daily_prices(data)
+            company_data = self.get_company_overview(symbol, use_cache)
             
             result = {
                 'current_price': daily_prices['current_price'],
@@ -126,57 +257,49 @@ class AlphaVantageAPI:
                 'pe_ratio': company_data['pe_ratio'],
                 'roe': company_data['roe']
             }
-            print(f"Successfully fetched metrics for {symbol}: {result}")
+            logger.debug("Successfully fetched metrics for %s: %s", symbol, result)
+            if self.cache_mode != 'disabled':
+                metrics_cache.set(cache_key, result)
             return result
             
-        except requests.exceptions.RequestException as e:
-            print(f"Network error for {symbol}: {str(e)}")
+        except (TransientAPIError, requests.exceptions.RequestException) as e:
+            # Throttling and network failures say nothing about the symbol, so
+            # surface them to the caller rather than reporting it as invalid
+            logger.warning("Alpha Vantage unavailable for %s: %s", symbol, e)
             demo_data = self._get_demo_data(symbol)
             if demo_data:
-                print(f"Falling back to demo data for {symbol}")
+                logger.debug("Falling back to demo data for %s", symbol)
                 return demo_data
-            return None
+            raise TransientAPIError(str(e)) from e
+        except CacheMissError:
+            raise
         except Exception as e:
-            print(f"Unexpected error fetching metrics for {symbol}: {str(e)}")
+            logger.warning("Unexpected error fetching metrics for %s: %s", symbol, e)
             demo_data = self._get_demo_data(symbol)
             if demo_data:
-                print(f"Falling back to demo data for {symbol}")
+                logger.debug("Falling back to demo data for %s", symbol)
                 return demo_data
             return None
 
+    def get_all_metrics_batch(self, symbols, use_cache=True, max_workers=5):
+        """
+        get_all_metrics for many symbols on a thread pool; the shared token bucket
+        keeps the combined request rate within ALPHA_VANTAGE_RPM.
+        Returns a dict of symbol -> metrics, None, or the exception raised for it.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.get_all_metrics, symbol, use_cache): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    results[symbol] = future.result()
+                except Exception as e:
+                    results[symbol] = e
+        return results
+
     def _get_demo_data(self, symbol):
         """Return demo data when API rate limit is reached"""
-        # Define known valid stocks with their demo data
-        demo_data = {
-            'AAPL': {
-                'current_price': 181.45,
-                'high_price': 182.34,
-                'low_price': 180.17,
-                'pe_ratio': 28.5,
-                'roe': 45.0
-            },
-            'GOOGL': {
-                'current_price': 2789.61,
-                'high_price': 2800.12,
-                'low_price': 2775.89,
-                'pe_ratio': 25.8,
-                'roe': 30.5
-            },
-            'MSFT': {
-                'current_price': 378.92,
-                'high_price': 380.15,
-                'low_price': 377.23,
-                'pe_ratio': 32.4,
-                'roe': 42.7
-            },
-            'TSLA': {
-                'current_price': 262.67,
-                'high_price': 265.12,
-                'low_price': 260.89,
-                'pe_ratio': 75.2,
-                'roe': 25.3
-            }
-        }
-        
         # Only return demo data for known valid stocks
-        return demo_data.get(symbol, None) 
\ No newline at end of file
+        demo_data = _DEMO_DATA.get(symbol)
+        return dict(demo_data) if demo_data else None
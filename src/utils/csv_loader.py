@@ -1,58 +1,104 @@
+import numpy as np
 import pandas as pd
+from sqlalchemy import bindparam, select, update
 from database.db_setup import SessionLocal, Stock
-from datetime import datetime
+
+# CSV columns copied onto Stock rows; symbol is the primary key the update matches on
+SYNC_COLUMNS = [
+    'symbol', 'analysis_date',
+    'analyst_ratings_buy', 'analyst_ratings_hold', 'analyst_ratings_sell',
+    'analyst_ratings_strong_sell', 'analyst_ratings_strong_buy',
+    'rsi', 'macd', 'volatility', 'sentiment_score', 'beta'
+]
+
+# Rating columns and their sentiment weights, from strong buy (+2) to strong sell (-2)
+RATING_COLUMNS = [
+    'analyst_ratings_strong_buy', 'analyst_ratings_buy', 'analyst_ratings_hold',
+    'analyst_ratings_sell', 'analyst_ratings_strong_sell'
+]
+RATING_WEIGHTS = np.array([2, 1, 0, -1, -2], dtype=np.float64)
+
+# Declared up front so pandas skips type inference; the float columns stay
+# float64 because float32 would store values like 65.3 as 65.30000305, and the
+# rating counts use the nullable Int32 so a blank cell is read as missing
+CSV_DTYPES = {
+    'symbol': 'string',
+    'analyst_ratings_buy': 'Int32',
+    'analyst_ratings_hold': 'Int32',
+    'analyst_ratings_sell': 'Int32',
+    'analyst_ratings_strong_sell': 'Int32',
+    'analyst_ratings_strong_buy': 'Int32',
+    'rsi': 'float64',
+    'macd': 'float64',
+    'volatility': 'float64',
+    'sentiment_score': 'float64',
+    'beta': 'float64'
+}
+
+# Rows read and written per batch, so large CSVs never sit in memory at once
+CHUNK_SIZE = 10000
+
+# Compiled once and executed with a list of rows as one executemany; parameters
+# are the SYNC_COLUMNS names prefixed with b_ so they don't clash with the columns
+UPDATE_ANALYST_DATA = (
+    update(Stock.__table__)
+    .where(Stock.__table__.c.symbol == bindparam('b_symbol'))
+    .values({name: bindparam(f'b_{name}') for name in SYNC_COLUMNS if name != 'symbol'})
+)
 
 class AnalystDataLoader:
     def __init__(self, csv_path):
         self.csv_path = csv_path
         
-    def load_data(self):
-        """Load analyst data from CSV file"""
+    def load_data(self, chunksize=CHUNK_SIZE):
+        """Open the analyst CSV as an iterator of DataFrames of up to chunksize rows"""
         try:
-            df = pd.read_csv(self.csv_path)
-            # Convert analysis_date to datetime
-            df['analysis_date'] = pd.to_datetime(df['analysis_date'])
-            print(f"Successfully loaded {len(df)} records from CSV")
-            return df
+            return pd.read_csv(
+                self.csv_path,
+                dtype=CSV_DTYPES,
+                parse_dates=['analysis_date'],
+                chunksize=chunksize
+            )
         except Exception as e:
             print(f"Error loading CSV file: {str(e)}")
             return None
             
     def sync_with_database(self):
-        """Sync analyst data with existing stock records"""
-        df = self.load_data()
-        if df is None:
+        """Sync analyst data with existing stock records, CHUNK_SIZE rows at a time"""
+        chunks = self.load_data()
+        if chunks is None:
             return
             
         db = SessionLocal()
         try:
-            # Get all stock symbols from our database
-            existing_stocks = db.query(Stock).all()
-            existing_symbols = {stock.symbol for stock in existing_stocks}
-            
-            # Filter CSV data to only include stocks in our database
-            mask = df['symbol'].isin(existing_symbols)
-            relevant_data = df[mask]
-            
-            # Update database with CSV data
-            for _, row in relevant_data.iterrows():
-                stock = db.query(Stock).filter(Stock.symbol == row['symbol']).first()
-                if stock:
-                    # Update stock with analyst data
-                    stock.analysis_date = row['analysis_date']
-                    stock.analyst_ratings_buy = row['analyst_ratings_buy']
-                    stock.analyst_ratings_hold = row['analyst_ratings_hold']
-                    stock.analyst_ratings_sell = row['analyst_ratings_sell']
-                    stock.analyst_ratings_strong_sell = row['analyst_ratings_strong_sell']
-                    stock.analyst_ratings_strong_buy = row['analyst_ratings_strong_buy']
-                    stock.rsi = row['rsi']
-                    stock.macd = row['macd']
-                    stock.volatility = row['volatility']
-                    stock.sentiment_score = row['sentiment_score']
-                    stock.beta = row['beta']
-                    
-            db.commit()
-            print(f"Successfully updated database with analyst data")
+            total = 0
+            for chunk in chunks:
+                # Ask the database which of this chunk's symbols it knows, rather
+                # than pulling the whole stocks table into Python
+                csv_symbols = chunk['symbol'].dropna().unique().tolist()
+                existing_symbols = set(db.scalars(
+                    select(Stock.symbol).where(Stock.symbol.in_(csv_symbols))
+                ).all())
+                
+                # Filter CSV data to only include stocks in our database; rows are
+                # applied in file order, so the latest one for a symbol wins
+                relevant_data = chunk.loc[chunk['symbol'].isin(existing_symbols), SYNC_COLUMNS]
+                if relevant_data.empty:
+                    continue
+                
+                # Rows without a sentiment score get the one implied by their ratings
+                sentiment = relevant_data['sentiment_score']
+                relevant_data = relevant_data.assign(
+                    sentiment_score=sentiment.where(sentiment.notna(), self.compute_sentiment_column(relevant_data))
+                )
+                # Missing values (pd.NA from the nullable ratings) are bound as NULL
+                relevant_data = relevant_data.astype(object).where(relevant_data.notna(), None)
+                db.connection().execute(
+                    UPDATE_ANALYST_DATA, relevant_data.add_prefix('b_').to_dict('records')
+                )
+                db.commit()
+                total += len(relevant_data)
+            print(f"Successfully updated database with analyst data ({total} records)")
             
         except Exception as e:
             db.rollback()
@@ -60,16 +106,20 @@ class AnalystDataLoader:
         finally:
             db.close()
 
+    @staticmethod
+    def _sentiment(counts_by_rating):
+        """Weighted sentiment for a 2-D array whose columns follow RATING_COLUMNS"""
+        total_ratings = counts_by_rating @ RATING_WEIGHTS
+        total_count = counts_by_rating.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total_count > 0, total_ratings / (total_count * 2), 0.0)
+
+    @classmethod
+    def compute_sentiment_column(cls, df):
+        """Overall analyst sentiment (-1 to 1) for every row of df as a numpy array"""
+        return cls._sentiment(df[RATING_COLUMNS].to_numpy(dtype=np.float64, na_value=0.0))
+
     def get_analyst_sentiment(self, row):
-        """Calculate overall analyst sentiment (-1 to 1)"""
-        total_ratings = (row['analyst_ratings_strong_buy'] * 2 +
-                        row['analyst_ratings_buy'] * 1 +
-                        row['analyst_ratings_hold'] * 0 +
-                        row['analyst_ratings_sell'] * -1 +
-                        row['analyst_ratings_strong_sell'] * -2)
-        total_count = (row['analyst_ratings_strong_buy'] +
-                      row['analyst_ratings_buy'] +
-                      row['analyst_ratings_hold'] +
-                      row['analyst_ratings_sell'] +
-                      row['analyst_ratings_strong_sell'])
-        return total_ratings / (total_count * 2) if total_count > 0 else 0 
\ No newline at end of file
+        """Calculate overall analyst sentiment (-1 to 1) for a single row"""
+        counts_by_rating = np.array([[row[name] for name in RATING_COLUMNS]], dtype=np.float64)
+        return float(self._sentiment(counts_by_rating)[0])
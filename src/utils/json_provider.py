@@ -0,0 +1,23 @@
+import orjson
+from flask.json.provider import JSONProvider
+
+# NumPy scalars and non-string keys are serialized natively instead of raising
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by the C-accelerated orjson library"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Build a JSON response from bytes, skipping the intermediate str"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=ORJSON_OPTIONS),
+            mimetype='application/json'
+        )
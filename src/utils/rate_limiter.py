@@ -0,0 +1,29 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket that makes callers wait instead of exceeding a rate"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # Tokens added per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket, sleeping until they are available.
+        Tokens are reserved under the lock, so concurrent callers queue fairly.
+        Returns the number of seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
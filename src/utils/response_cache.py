@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Persistent SQLite-backed cache for API responses with per-entry expiry"""
+
+    def __init__(self, path: str, ttl: int = 86400):
+        self.path = path
+        self.ttl = ttl
+        self._memory: Dict[str, Tuple[float, Any]] = {}
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Build a stable cache key from its parts"""
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the cache database on first use"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(key TEXT PRIMARY KEY, expires_at REAL, payload TEXT)'
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                try:
+                    row = self._connect().execute(
+                        'SELECT expires_at, payload FROM responses WHERE key = ?', (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.error("Error reading cache: %s", e)
+                    return None
+                if row is None:
+                    return None
+                entry = (row[0], json.loads(row[1]))
+                self._memory[key] = entry
+        if entry[0] < now:
+            return None
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """Store value under key for ttl seconds (defaults to the cache ttl)"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            try:
+                conn = self._connect()
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, expires_at, payload) VALUES (?, ?, ?)',
+                    (key, expires_at, json.dumps(value))
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error("Error saving cache: %s", e)
@@ -0,0 +1,9 @@
+def dcf_factor(growth_rate, discount_rate, years):
+    """
+    Sum of ((1 + g) / (1 + r)) ** year for years 1..n, i.e. the present value of
+    n years of a cash flow of 1 growing at g, via the growing-annuity closed form
+    """
+    ratio = (1 + growth_rate) / (1 + discount_rate)
+    if ratio == 1:
+        return float(years)
+    return ratio * (1 - ratio ** years) / (1 - ratio)
@@ -0,0 +1,35 @@
+import asyncio
+
+from src.integration.integration_system import DataIntegrationSystem
+
+
+class FakeAlphaVantageSource:
+    """Serves canned Alpha Vantage payloads from its cache, so nothing hits the network"""
+    RESPONSES = {
+        'GLOBAL_QUOTE': {'Global Quote': {'05. price': '100.0', '06. volume': '1000'}},
+        'OVERVIEW': {'PERatio': '20', 'ReturnOnEquityTTM': '25', 'EPS': '6.0'}
+    }
+
+    def get_cached(self, query):
+        return self.RESPONSES[query['function']]
+
+    async def aexecute_query(self, query):
+        return self.RESPONSES[query['function']]
+
+
+def test_integrate_many_without_analyst_source():
+    system = DataIntegrationSystem()
+    try:
+        results = asyncio.run(
+            system.integrate_many(['AAPL', 'MSFT'], FakeAlphaVantageSource(), None)
+        )
+    finally:
+        system.close()
+
+    assert list(results) == ['AAPL', 'MSFT']
+    for symbol, data in results.items():
+        assert 'error' not in data
+        assert data['symbol'] == symbol
+        assert data['analyst_data']['ratings']['buy'] == 0
+        assert data['buffet_analysis']['pe_score'] == 0.05
+        assert data['buffet_analysis']['roe_score'] == 0.25
@@ -1,10 +1,6 @@
 import os
-import sys
-
-# Add the src directory to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.app import app
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5001))) 
\ No newline at end of file
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5001))) 